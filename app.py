@@ -1,12 +1,14 @@
-from typing import get_args
+from typing import get_args, List, Optional
 import streamlit as st
 import argparse
 import logging
+import uuid
+import re
 import os
 
-from src.huntmate_core import HuntMate
+from src.search_worker import BackgroundSearch
 from src.settings import AppConfig
-from src.models import WorkMode, ExperienceLevel, JobSearchParams
+from src.models import WorkMode, ExperienceLevel, JobSearchParams, Location
 
 
 # Set page configuration
@@ -27,6 +29,83 @@ def tight_label(text: str):
     st.markdown(f'<div class="tight-label">{text}</div>', unsafe_allow_html=True)
 
 
+def parse_locations(text: str) -> Optional[List[Location]]:
+    """Parse "City (Country)" entries, taking the country of plain city names from the prefilled form.
+    Returns None if a country is unknown."""
+    known = {location.city.lower(): location for location in getattr(st.session_state.form_prefill, "locations", [])}
+    locations = []
+    for entry in [entry.strip() for entry in text.split(",") if entry.strip()]:
+        match = re.fullmatch(r"(.+?)\s*\((.+)\)", entry)
+        if match:
+            locations.append(Location(city=match.group(1).strip(), country=match.group(2).strip()))
+        elif entry.lower() in known:
+            locations.append(known[entry.lower()])
+        else:
+            return None
+    return locations
+
+
+def search_params_from_form(limit, remote, experience, job_type, locations, job_keywords, other_preferences) -> Optional[JobSearchParams]:
+    """Build the job search parameters directly from the form fields, or None if they can't be used as-is"""
+    parsed_locations = parse_locations(locations)
+    keywords = [keyword.strip() for keyword in job_keywords.split(",") if keyword.strip()]
+    if not parsed_locations or not keywords:
+        return None
+    work_modes = {e.name.replace("_", "").capitalize(): e for e in WorkMode}
+    experience_levels = {e.name.replace("_", " ").capitalize(): e for e in ExperienceLevel}
+    return JobSearchParams(
+        steps=[],
+        job_keywords=keywords,
+        locations=parsed_locations,
+        work_mode=[work_modes[mode] for mode in remote],
+        experience=[experience_levels[level] for level in experience],
+        job_type=job_type,
+        limit=limit,
+        extra_preferences=other_preferences.strip(),
+    )
+
+
+# The user ids put in the URL, anything else is replaced so it can't point outside SESSIONS_DIR
+USER_ID_PATTERN = re.compile(r"[0-9a-f]{32}")
+
+
+@st.cache_resource(show_spinner="Starting HuntMate...")
+def load_chatbot(model_name: str):
+    """One HuntMate per process, shared by all sessions, it is imported here so the first page renders before its heavy dependencies load.
+    It holds the workflow, the stateless clients and caches and the open ChatSession of every user, keyed by the user id of the URL"""
+    from src.huntmate_core import HuntMate
+    return HuntMate(model_name=model_name)
+
+
+@st.fragment(run_every=AppConfig.SEARCH_PROGRESS_REFRESH)
+def search_status():
+    """Show the progress and the strong matches of the background job search, until it is done"""
+    search = st.session_state.search
+    get_chat()  # Keeps the chat of a long search from being closed as idle
+    if search.is_done():
+        st.session_state.messages.append({"role": "assistant", "content": search.response})
+        st.session_state.search = None
+        st.rerun()
+
+    with st.chat_message("assistant"):
+        progress = search.progress
+        if search.cancelled:
+            st.markdown("Cancelling the search...")
+        elif progress:
+            st.progress(
+                progress["combinations_scraped"] / max(progress["combinations"], 1),
+                text=f"Searched {progress['combinations_scraped']}/{progress['combinations']} keyword and location pairs, "
+                     f"found {progress['jobs_found']} jobs, scored {progress['jobs_scored']}, "
+                     f"{progress['strong_matches']} strong matches",
+            )
+        else:
+            st.markdown("Searching for jobs based on your preferences...")
+        st.button("Cancel search", on_click=search.cancel, disabled=search.cancelled)
+        # Strong matches are shown as soon as they are scored, the final response lists them sorted by score
+        if search.matches:
+            st.markdown("### 🔍 Best matches so far:\n" + "".join(get_chatbot().job_details_output(job, match) for job, match in list(search.matches)))
+
+
 class CheckBoxArray:
     def __init__(self, name: str, anchor, checkboxes: list[str], max_select: int, num_cols=1):
         self.name = name
@@ -59,7 +138,18 @@ if "show_job_form" not in st.session_state:
 if "form_prefill" not in st.session_state:
     st.session_state.form_prefill = None
 
-if "chatbot" not in st.session_state:
+if "search" not in st.session_state:
+    st.session_state.search = None
+
+if "user_id" not in st.session_state:
+    # The id is kept in the URL so a reload or a bookmark opens the same memory and chat history
+    user_id = st.query_params.get("user", "")
+    if not USER_ID_PATTERN.fullmatch(user_id):
+        user_id = uuid.uuid4().hex
+        st.query_params["user"] = user_id
+    st.session_state.user_id = user_id
+
+if "model_name" not in st.session_state:
     logging.basicConfig(
         filename="huntmate.log",
         level=logging.INFO,
@@ -72,9 +162,16 @@ if "chatbot" not in st.session_state:
     parser = argparse.ArgumentParser()
     parser.add_argument("--model_name", type=str, default="gpt-4o-mini", help="The name of the model to use.")
     args = parser.parse_args()
-    st.session_state.chatbot = HuntMate(model_name=args.model_name)
+    st.session_state.model_name = args.model_name
+
 
-chatbot = st.session_state.chatbot
+def get_chatbot():
+    return load_chatbot(st.session_state.model_name)
+
+
+def get_chat():
+    """The memory, chat history and jobs of this user, shared by the chatbot so every tab of the user gets the same chat"""
+    return get_chatbot().chats.get(st.session_state.user_id)
 
 # Sidebar
 with st.sidebar:
@@ -87,10 +184,11 @@ with st.sidebar:
     st.markdown("### Quick Actions")
     if st.button("Start New Chat", use_container_width=True):
         st.session_state.messages = []
+        if st.session_state.search is not None:
+            st.session_state.search.cancel()
+            st.session_state.search = None
         # Clear chat history and job search data
-        if os.path.exists("./db"):
-            for file in os.listdir("./db"):
-                os.remove(os.path.join("./db", file))   
+        get_chatbot().start_new_chat(get_chat())
         st.session_state.show_job_form = False
         st.rerun()
     
@@ -116,6 +214,10 @@ with chat_container:
         with st.chat_message(message["role"]):
             st.markdown(message["content"])
 
+# The job search runs in the background, only its progress is refreshed while it runs
+if st.session_state.search is not None:
+    search_status()
+
 # Show form if triggered
 if st.session_state.show_job_form:
     with st.form(key="job_form", clear_on_submit=False):
@@ -164,8 +266,8 @@ if st.session_state.show_job_form:
             tight_label("Location:")
             locations = st.text_input(
                 label="location", label_visibility="hidden",
-                value=", ".join(getattr(st.session_state.form_prefill, "locations", [])),
-                placeholder="e.g., New York, Toronto"
+                value=", ".join(f"{location.city} ({location.country})" for location in getattr(st.session_state.form_prefill, "locations", [])),
+                placeholder="e.g., New York (United States), Toronto (Canada)"
             )
 
             tight_label("Job keywords:")
@@ -204,13 +306,17 @@ if st.session_state.show_job_form:
                 if st.session_state.get(f"cb_jobs_{i}", False)
             ]
 
-            with st.spinner("Searching for jobs based on your preferences..."):
-                response = chatbot.run(explanation, skip_router=True, filled_job_form=True, websites=selected_websites)
-                with st.chat_message("assistant"):
-                    st.markdown(response)
-                st.session_state.messages.append({"role": "assistant", "content": response})
-                st.session_state.show_job_form = False
-                st.rerun()
+            # The form fields are already structured, the LLM only parses them when a location is missing its country
+            search_params = search_params_from_form(limit, remote, experience, job_type, locations, job_keywords, other_preferences)
+
+            if st.session_state.search is not None:
+                st.session_state.search.cancel()
+            st.session_state.search = BackgroundSearch(
+                get_chatbot(),
+                user_input=explanation, skip_router=True, filled_job_form=True, websites=selected_websites, job_search_params=search_params, chat=get_chat(),
+            ).start()
+            st.session_state.show_job_form = False
+            st.rerun()
 
 # Chat input
 if prompt := st.chat_input("Ask me anything about job searching..."):
@@ -223,8 +329,14 @@ if prompt := st.chat_input("Ask me anything about job searching..."):
         message_placeholder = st.empty()
         message_placeholder.markdown("Thinking...")
         
-        # Get response from chatbot
-        response = chatbot.run(prompt, skip_router=False, filled_job_form=False)
+        # Stream the response from the chatbot as it is generated
+        response = ""
+        for event in get_chatbot().run_stream(prompt, skip_router=False, filled_job_form=False, chat=get_chat()):
+            if "token" in event:
+                response += event["token"]
+                message_placeholder.markdown(response + "▌")
+            elif "final_response" in event:
+                response = event["final_response"]
         
         # Clear the "thinking" message
         message_placeholder.empty()
@@ -236,3 +348,6 @@ if prompt := st.chat_input("Ask me anything about job searching..."):
             # Display the response with a slight delay for a more natural feel
             message_placeholder.markdown(response)
             st.session_state.messages.append({"role": "assistant", "content": response})
+
+# Load the chatbot once the page is rendered, so the first message doesn't wait for it
+get_chatbot()
@@ -0,0 +1,88 @@
+"""Benchmark the job de-duplication on synthetic postings.
+
+Run from the repository root:  python -m benchmarks.bench_dedup
+"""
+from typing import List, Dict
+import argparse
+import random
+import time
+
+import Levenshtein
+
+from src.tools.job_dedup import JobDeduplicator
+
+
+SYLLABLES = ["ka", "lo", "mi", "tra", "zen", "vor", "qui", "bel", "dax", "nu", "fy", "ro", "sta", "pex", "gil"]
+SUFFIXES = ["", " Inc.", " Labs", " Technologies", " Canada", " Group"]
+LEVELS = ["", "Senior ", "Junior ", "Staff ", "Lead ", "Principal "]
+DOMAINS = ["Data", "Machine Learning", "Software", "Backend", "Frontend", "Platform", "Security", "Cloud", "Mobile", "Research",
+           "Analytics", "Infrastructure", "Quality", "Product", "Marketing", "Sales", "Finance", "Healthcare", "Robotics", "Vision"]
+ROLES = ["Engineer", "Scientist", "Developer", "Manager", "Analyst", "Architect", "Specialist", "Consultant"]
+
+
+def make_jobs(n: int, seed: int = 0) -> List[Dict[str, str]]:
+    """Synthetic jobs: a pool of companies posting the same roles on several boards, plus a few missing values"""
+    rng = random.Random(seed)
+    companies = ["".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))).capitalize() for _ in range(max(n // 20, 1))]
+    jobs = []
+    for _ in range(n):
+        company = rng.choice(companies) + rng.choice(SUFFIXES)
+        title = rng.choice(LEVELS) + rng.choice(DOMAINS) + " " + rng.choice(ROLES)
+        if rng.random() < 0.001:
+            company = float("nan")
+        jobs.append({"company": company, "title": title})
+    return jobs
+
+
+def make_distinct_jobs(n: int, seed: int = 0) -> List[Dict[str, str]]:
+    """Synthetic jobs with random company names and titles, so most of them are unique (the worst case)"""
+    rng = random.Random(seed)
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    words = ["".join(rng.choice(letters) for _ in range(rng.randint(4, 9))) for _ in range(500)]
+    jobs = []
+    for _ in range(n):
+        company = "".join(rng.choice(letters) for _ in range(rng.randint(6, 12)))
+        title = " ".join(rng.choice(words) for _ in range(3))
+        jobs.append({"company": company, "title": title})
+    return jobs
+
+
+def legacy_remove_duplicate_jobs(all_jobs: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    """The original pairwise implementation, used as the reference output"""
+
+    def is_similar(str1: str, str2: str, threshold: float = 0.5) -> bool:
+        if type(str1) != str or type(str2) != str:
+            return True
+        return Levenshtein.ratio(str1.lower(), str2.lower()) >= threshold
+
+    unique_jobs = []
+    for job in all_jobs:
+        if not any(is_similar(job["company"], u["company"]) and is_similar(job["title"], u["title"]) for u in unique_jobs):
+            unique_jobs.append(job)
+    return unique_jobs
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--distinct", action="store_true", help="Use mostly unique jobs instead of a pool of re-posted jobs.")
+    parser.add_argument("--legacy_max", type=int, default=10000, help="Largest size to also run the pairwise reference on.")
+    args = parser.parse_args()
+
+    for n in args.sizes:
+        jobs = make_distinct_jobs(n) if args.distinct else make_jobs(n)
+        start = time.perf_counter()
+        unique = JobDeduplicator().deduplicate(jobs)
+        elapsed = time.perf_counter() - start
+        line = f"{n:>6} jobs: {len(unique):>6} unique in {elapsed:8.3f}s"
+        if n <= args.legacy_max:
+            start = time.perf_counter()
+            reference = legacy_remove_duplicate_jobs(jobs)
+            legacy_elapsed = time.perf_counter() - start
+            same = [id(job) for job in unique] == [id(job) for job in reference]
+            line += f" | pairwise {legacy_elapsed:8.3f}s | same output: {same}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
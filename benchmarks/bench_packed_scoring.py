@@ -0,0 +1,89 @@
+"""Compare packed scoring (several jobs per request) with single job scoring on jobs from the job catalog.
+
+Reports the tokens per job, the time and the agreement of the scores. Calls the LLM, so it needs an api.cfg.
+Run from the repository root:  python -m benchmarks.bench_packed_scoring --keywords "Machine Learning" --jobs 64
+"""
+from typing import List, Dict, Tuple
+import configparser
+import argparse
+import sqlite3
+import time
+import os
+
+from src.llm_client import LLMClient
+from src.llm_executor import ScoringExecutor
+from src.models import JobMatch, JobMatchList, JobSearchParams
+from src.prompts import check_job_match, check_job_matches
+from src.scoring import STRONG_MATCH_SCORE, parse_job_match, parse_job_matches, pack_jobs
+from src.settings import AppConfig
+
+
+def load_jobs(path: str, count: int) -> List[Dict[str, str]]:
+    """The most recently scraped jobs of the catalog that have a description"""
+    conn = sqlite3.connect(path)
+    rows = conn.execute("SELECT title, company, description FROM jobs WHERE description IS NOT NULL AND description != '' "
+                        "ORDER BY fetched_at DESC LIMIT ?", (count,)).fetchall()
+    return [{"title": title, "company": company, "job_description": description} for title, company, description in rows]
+
+
+def tokens(responses: list) -> Tuple[int, int]:
+    prompt = sum(res.usage.prompt_tokens for res in responses if not isinstance(res, Exception))
+    completion = sum(res.usage.completion_tokens for res in responses if not isinstance(res, Exception))
+    return prompt, completion
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model_name", type=str, default="gpt-4o-mini", help="The name of the model to use.")
+    parser.add_argument("--keywords", type=str, nargs="+", default=["Machine Learning"], help="Job keywords of the search.")
+    parser.add_argument("--extra_preferences", type=str, default="", help="Extra preferences of the search.")
+    parser.add_argument("--jobs", type=int, default=64, help="Number of jobs to score.")
+    parser.add_argument("--catalog", type=str, default=AppConfig.JOB_CATALOG_PATH, help="Job catalog to take the jobs from.")
+    args = parser.parse_args()
+
+    config = configparser.ConfigParser()
+    config.read('./api.cfg')
+    os.environ["OPENAI_API_KEY"] = config['openai']['api_key']
+
+    jobs = load_jobs(args.catalog, args.jobs)
+    if not jobs:
+        raise SystemExit(f"No jobs in {args.catalog}, run a search first")
+    search_params = JobSearchParams(steps=[], job_keywords=args.keywords, locations=[], work_mode=[], experience=[], job_type=[],
+                                    limit=len(jobs), extra_preferences=args.extra_preferences)
+    # No completion cache, both modes must really call the LLM
+    executor = ScoringExecutor(LLMClient(args.model_name, cache=None))
+
+    start_time = time.time()
+    messages = [check_job_match(search_params, job["title"], job["company"], job["job_description"], []) for job in jobs]
+    single_responses = executor.map(messages, response_format=JobMatch)
+    single_time = time.time() - start_time
+    single = [None if isinstance(res, Exception) else parse_job_match(res.choices[0].message.content) for res in single_responses]
+
+    start_time = time.time()
+    packs = pack_jobs(jobs)
+    messages = [check_job_matches(search_params, [jobs[i] for i in pack], []) for pack in packs]
+    packed_responses = executor.map(messages, response_format=JobMatchList)
+    packed_time = time.time() - start_time
+    packed = [None] * len(jobs)
+    for pack, res in zip(packs, packed_responses):
+        if not isinstance(res, Exception):
+            for position, result in parse_job_matches(res.choices[0].message.content, len(pack)).items():
+                packed[pack[position]] = result
+
+    print(f"{len(jobs)} jobs, {len(packs)} packs of {len(jobs) / len(packs):.1f} jobs on average\n")
+    print(f"{'mode':<8} {'prompt tok/job':>15} {'output tok/job':>15} {'seconds':>8} {'missing':>8}")
+    for mode, responses, results, seconds in (("single", single_responses, single, single_time), ("packed", packed_responses, packed, packed_time)):
+        prompt, completion = tokens(responses)
+        print(f"{mode:<8} {prompt / len(jobs):>15.0f} {completion / len(jobs):>15.0f} {seconds:>8.1f} {results.count(None):>8}")
+
+    pairs = [(a.match_score, b.match_score) for a, b in zip(single, packed) if a is not None and b is not None]
+    if pairs:
+        print(f"\nAgreement on {len(pairs)} jobs scored by both modes:")
+        print(f"  same score:          {sum(a == b for a, b in pairs) / len(pairs):.1%}")
+        print(f"  within one point:    {sum(abs(a - b) <= 1 for a, b in pairs) / len(pairs):.1%}")
+        print(f"  same strong match:   {sum((a >= STRONG_MATCH_SCORE) == (b >= STRONG_MATCH_SCORE) for a, b in pairs) / len(pairs):.1%}")
+        print(f"  mean packed - single: {sum(b - a for a, b in pairs) / len(pairs):+.2f}")
+
+
+if __name__ == "__main__":
+    main()
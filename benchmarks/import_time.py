@@ -0,0 +1,50 @@
+"""Report which packages dominate the import time of a module, from python -X importtime.
+
+Run from the repository root:  python -m benchmarks.import_time [--module src.huntmate_core] [--top 20]
+"""
+from typing import Dict, List, Tuple
+import subprocess
+import argparse
+import sys
+
+
+def import_times(module: str) -> List[Tuple[str, int, int]]:
+    """Import the module in a fresh interpreter, returning (module, self, cumulative) times in microseconds"""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], capture_output=True, text=True)
+    if result.returncode != 0:
+        sys.exit(result.stderr)
+    times = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        times.append((name.strip(), int(self_us), int(cumulative_us)))
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--module", type=str, default="src.huntmate_core", help="The module to import.")
+    parser.add_argument("--top", type=int, default=20, help="Number of packages and modules to show.")
+    args = parser.parse_args()
+
+    times = import_times(args.module)
+    total = next(cumulative for name, _, cumulative in reversed(times) if name == args.module)
+    print(f"import {args.module}: {total / 1e6:.2f} s\n")
+
+    # The self time of every module, summed per top-level package
+    packages: Dict[str, int] = {}
+    for name, self_us, _ in times:
+        package = name.split(".")[0]
+        packages[package] = packages.get(package, 0) + self_us
+    print(f"{'package':<30} {'seconds':>8} {'share':>6}")
+    for package, self_us in sorted(packages.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"{package:<30} {self_us / 1e6:>8.3f} {self_us / total:>6.1%}")
+
+    print(f"\n{'slowest modules (cumulative)':<50} {'seconds':>8}")
+    for name, _, cumulative in sorted(times, key=lambda item: -item[2])[:args.top]:
+        print(f"{name:<50} {cumulative / 1e6:>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+from typing import Dict
+import threading
+import logging
+import shutil
+import time
+import os
+
+from src.storage import HuntMateStore
+from src.session_memory import SessionMemory
+from src.seen_jobs import SeenJobsIndex
+from src.job_index import SessionJobIndex
+from src.settings import AppConfig
+
+
+logger = logging.getLogger(__name__)
+
+# Everything that belongs to one user: the memory, the chat history, the seen jobs and the jobs shown in this chat
+class ChatSession:
+    def __init__(self, store: HuntMateStore, seen_jobs_dir: str = AppConfig.SEEN_JOBS_DIR) -> None:
+        self.store = store
+        self.memory = SessionMemory(store)
+        self.seen_jobs = SeenJobsIndex(store, seen_jobs_dir)
+        self.job_index = SessionJobIndex()
+
+    @classmethod
+    def for_user(cls, user_id: str, directory: str = AppConfig.SESSIONS_DIR) -> "ChatSession":
+        """A chat with its own store and seen jobs under directory, so users of the same process don't share them"""
+        directory = os.path.join(directory, user_id)
+        return cls(HuntMateStore(os.path.join(directory, "huntmate.sqlite")), os.path.join(directory, "seen_jobs"))
+
+    def clear(self) -> None:
+        """Forget the memory, the chat history and the seen jobs of this user"""
+        self.memory.clear()
+        self.seen_jobs.clear()
+        self.job_index = SessionJobIndex()
+
+    def close(self) -> None:
+        """Write what is pending and close the store, the chat can't be used afterwards"""
+        self.memory.close()
+        self.seen_jobs.flush()
+        self.store.close()
+
+
+# The open chats of the process by user id, one per user however many tabs they have open
+class ChatSessions:
+    """Chats idle for SESSION_IDLE_TIMEOUT are closed, and the stores of users not seen for SESSION_RETENTION are deleted"""
+
+    def __init__(self, directory: str = AppConfig.SESSIONS_DIR, idle_timeout: float = AppConfig.SESSION_IDLE_TIMEOUT,
+                 retention: float = AppConfig.SESSION_RETENTION) -> None:
+        self.directory = directory
+        self.idle_timeout = idle_timeout
+        self.retention = retention
+        self._lock = threading.Lock()
+        self._chats: Dict[str, ChatSession] = {}
+        self._last_used: Dict[str, float] = {}
+        self._swept_at = 0.0
+        os.makedirs(directory, exist_ok=True)
+
+    def get(self, user_id: str) -> ChatSession:
+        """The chat of a user, opened from their store if it isn't open yet"""
+        now = time.time()
+        with self._lock:
+            chat = self._chats.get(user_id)
+            if chat is None:
+                chat = self._chats[user_id] = ChatSession.for_user(user_id, self.directory)
+            self._last_used[user_id] = now
+            idle = [other for other, last_used in self._last_used.items() if now - last_used > self.idle_timeout]
+            closed = [self._chats.pop(other) for other in idle]
+            for other in idle:
+                del self._last_used[other]
+        for other_chat in closed:
+            other_chat.close()
+        if now - self._swept_at >= AppConfig.SESSION_SWEEP_INTERVAL:
+            self.sweep()
+        return chat
+
+    def sweep(self) -> None:
+        """Delete the stores of the users not seen for the retention period, judged by their last written file"""
+        now = time.time()
+        self._swept_at = now
+        with self._lock:
+            open_users = set(self._chats)
+        removed = 0
+        for user_id in os.listdir(self.directory):
+            path = os.path.join(self.directory, user_id)
+            if user_id in open_users or not os.path.isdir(path):
+                continue
+            last_written = max((os.path.getmtime(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names),
+                               default=os.path.getmtime(path))
+            if now - last_written > self.retention:
+                shutil.rmtree(path, ignore_errors=True)
+                removed += 1
+        if removed:
+            logger.info("Removed the stores of %s users not seen for %s days", removed, int(self.retention / (24*60*60)))
@@ -1,14 +1,14 @@
-from langchain_core.runnables.graph import CurveStyle, MermaidDrawMethod, NodeStyles
+from langchain_core.runnables import RunnableLambda
 from langgraph.graph import StateGraph, START, END
-from IPython.display import Image, display
-from litellm import batch_completion, completion
-from typing import List, Dict, Any
+from langgraph.config import get_stream_writer
+from typing import List, Dict, Any, Tuple, Optional, Callable, Iterator
 import streamlit as st
-import pandas as pd
+import asyncio
 import configparser
-import Levenshtein
+import functools
 import logging
-import shutil
+import threading
+import queue
 import time
 import json
 import os
@@ -16,8 +16,19 @@ import os
 
 from src.settings import AppConfig
 from src.tools.jobspy_search import JobSpySearchTool
+from src.tools.job_catalog import JobCatalog
 # from src.tools.linkedin_search import LinkedinSearchTool
-from src.models import JobMatch, Route, State, JobSearchParams, JobUserMention
+from src.scoring import ScoringQueue, STRONG_MATCH_SCORE, parse_job_match, parse_job_matches, pack_jobs
+from src.ranking import KeywordMatcher
+from src.llm_cache import CompletionCache
+from src.llm_client import LLMClient
+from src.llm_executor import ScoringExecutor, SearchCancelled
+from src.intent_router import IntentRouter
+from src.score_store import JobScoreStore
+from src.storage import HuntMateStore
+from src.chat_session import ChatSession, ChatSessions
+from src.metrics import metrics
+from src.models import JobMatch, JobMatchList, Route, State, JobSearchParams, JobUserMention
 from src.prompts import *
 
 
@@ -34,8 +45,13 @@ class HuntMate:
         config.read('./api.cfg')
         os.environ["OPENAI_API_KEY"] = config['openai']['api_key']
         self.model_name = model_name
+        self.llm = LLMClient(model_name, cache=CompletionCache())
+        self.router = IntentRouter(self.llm)
+        self.scoring_executor = ScoringExecutor(self.llm)
+        self.score_store = JobScoreStore()
         # self.linkedin_tool = LinkedinSearchTool()
-        self.jobspy_tool = JobSpySearchTool()
+        self.jobspy_tool = JobSpySearchTool(JobCatalog())
+        self.chats = ChatSessions()
         self.create_workflow()
         
         
@@ -47,54 +63,50 @@ class HuntMate:
         st.session_state
 
     def clean_cache(self) -> None:
-        """Clean the cache before running the application"""
-        if os.path.exists("./src/tools/__pycache__"):
-            shutil.rmtree("./src/tools/__pycache__")
-        if os.path.exists("./src/my_linkedin_api/__pycache__"):
-            shutil.rmtree("./src/my_linkedin_api/__pycache__")
-        if os.path.exists("./src/__pycache__"):
-            shutil.rmtree("./src/__pycache__")
-        if os.path.exists("db"):
-            # RESET the memory
-            for file in os.listdir("db"):
-                file_path = os.path.join("db", file)
-                if os.path.isfile(file_path):
-                    os.remove(file_path)
-        # Ensure the db directory exists
+        """Prepare the db directory before running the application, the bytecode caches are kept for a fast start"""
         os.makedirs("db", exist_ok=True)
 
+    @functools.cached_property
+    def default_chat(self) -> ChatSession:
+        """The chat of the callers that don't bring their own, kept in the default store"""
+        return ChatSession(HuntMateStore())
+
+    def start_new_chat(self, chat: Optional[ChatSession] = None) -> None:
+        """Forget the memory, the chat history and the seen jobs of one user"""
+        (chat or self.default_chat).clear()
+
     def load_personal_memory(self, state) -> List[str]: 
-        """Load the memory from the user_info_memory.csv file"""
-        if os.path.exists("db/user_info_memory.csv"):
-            df = pd.read_csv("db/user_info_memory.csv")
-            if not df.empty:
-                return df["Information"].tolist() + state.get("information_to_memorize", [])
-        return state.get("information_to_memorize", [])
+        """Load the memory stored about the user"""
+        return state["chat"].memory.memory() + state.get("information_to_memorize", [])
 
     
     def main_task_router(self, state: State) -> Dict[str, Any]:
         """Route the input to the appropriate node"""
         logger.info("In the router %s", state["skip_router"])
         if state["skip_router"]:
-            return {"route_decision": "job_search"}
+            return {"route_decision": "job_search", "route_tier": "skipped"}
         else:
-            response = completion(
-                model= self.model_name,
-                messages=router_prompt(state["user_input"]),
-                response_format=Route,
-            )
-            json_content = response.choices[0].message.content
-            decision = Route.parse_raw(json_content)
-
-            if decision.information_to_memorize: 
-                info = state.get("information_to_memorize", []) + [decision.information_to_memorize]
-            else: 
-                info = state.get("information_to_memorize", [])
-
-            logger.info("Memory: %s", info)
-            logger.info("route_decision: %s", decision.route)
-
-            return {"route_decision": decision.route, "information_to_memorize": info}
+            decision, tier = self.router.route(state["user_input"])
+            return self.route_update(state, decision, tier)
+
+    async def amain_task_router(self, state: State) -> Dict[str, Any]:
+        """Async version of main_task_router"""
+        if state["skip_router"]:
+            return {"route_decision": "job_search", "route_tier": "skipped"}
+        decision, tier = await self.router.aroute(state["user_input"])
+        return self.route_update(state, decision, tier)
+
+    def route_update(self, state: State, decision: Route, tier: str) -> Dict[str, Any]:
+        """State update of the router node"""
+        if decision.information_to_memorize: 
+            info = state.get("information_to_memorize", []) + [decision.information_to_memorize]
+        else: 
+            info = state.get("information_to_memorize", [])
+
+        logger.info("Memory: %s", info)
+        logger.info("route_decision: %s", decision.route)
+
+        return {"route_decision": decision.route, "route_tier": tier, "information_to_memorize": info}
     
     def route_decision(self, state: State) -> str:
         """Conditional edge function to route to the appropriate node"""
@@ -113,29 +125,62 @@ class HuntMate:
             }
         return route_map.get(state["route_decision"], "unsupported_task")
         
+    def stream_text(self, messages: List[Dict[str, str]]) -> str:
+        """Run a text completion, writing its tokens to the workflow's custom stream as they arrive"""
+        write = get_stream_writer()
+        text = ""
+        for token in self.llm.stream_completion(messages):
+            text += token
+            write({"token": token})
+        return text
+
+    async def astream_text(self, messages: List[Dict[str, str]]) -> str:
+        """Async version of stream_text"""
+        write = get_stream_writer()
+        text = ""
+        async for token in self.llm.astream_completion(messages):
+            text += token
+            write({"token": token})
+        return text
+
     def craft_email(self, state: State) -> Dict[str, Any]:
         job_description = self.find_exact_job(state)
         memory_personal = self.load_personal_memory(state)
-        response = completion(
-            model=self.model_name,
-            messages=craft_email_prompt(state["user_input"], memory_personal, job_description),
-            response_format=None
-        )
-        cover_letter = response.choices[0].message.content
+        cover_letter = self.stream_text(craft_email_prompt(state["user_input"], memory_personal, job_description))
         return {"final_response": cover_letter}
+
+    async def acraft_email(self, state: State) -> Dict[str, Any]:
+        """Async version of craft_email"""
+        job_description = await self.afind_exact_job(state)
+        memory_personal = self.load_personal_memory(state)
+        return {"final_response": await self.astream_text(craft_email_prompt(state["user_input"], memory_personal, job_description))}
     
     def find_exact_job(self, state: State) -> str:
         """Find the exact job the user is selecting based on the user's input and history"""
-        chat_history = []
-        if os.path.exists("db/chat_history.csv"):
-            chat_history = pd.read_csv("db/chat_history.csv")["chat_history"].tolist()
-
-        response = completion(
-            model=self.model_name,
-            messages=find_job_user_mentioned_prompt(state["user_input"], chat_history),
-            response_format=JobUserMention,  
-        )
-        json_content = response.choices[0].message.content
+        job = state["chat"].job_index.resolve(state["user_input"])
+        if job is not None:
+            return state["chat"].job_index.describe(job)
+
+        # Ask the LLM only when the job couldn't be resolved from the jobs shown in this session
+        metrics.increment("job_index.llm_fallback")
+        chat_history = state["chat"].memory.chat_history(AppConfig.CHAT_HISTORY_CONTEXT)
+
+        response = self.llm.completion(find_job_user_mentioned_prompt(state["user_input"], chat_history), response_format=JobUserMention)
+        return self.mentioned_job_description(state, response.choices[0].message.content)
+
+    async def afind_exact_job(self, state: State) -> str:
+        """Async version of find_exact_job"""
+        job = state["chat"].job_index.resolve(state["user_input"])
+        if job is not None:
+            return state["chat"].job_index.describe(job)
+
+        metrics.increment("job_index.llm_fallback")
+        chat_history = state["chat"].memory.chat_history(AppConfig.CHAT_HISTORY_CONTEXT)
+        response = await self.llm.acompletion(find_job_user_mentioned_prompt(state["user_input"], chat_history), response_format=JobUserMention)
+        return self.mentioned_job_description(state, response.choices[0].message.content)
+
+    def mentioned_job_description(self, state: State, json_content: str) -> str:
+        """Job description from the LLM's answer about the job the user mentioned"""
         result = JobUserMention.parse_raw(json_content)
         if result.description == "No job matched.":
             return state["user_input"]
@@ -156,23 +201,28 @@ class HuntMate:
         """Generate a cover letter based on user input and memory"""
         job_description = self.find_exact_job(state)
         memory_personal = self.load_personal_memory(state)
-        response = completion(
-            model=self.model_name,
-            messages=craft_coverletter_prompt(state["user_input"], memory_personal, job_description),
-            response_format=None
-        )
-        cover_letter = response.choices[0].message.content
+        cover_letter = self.stream_text(craft_coverletter_prompt(state["user_input"], memory_personal, job_description))
         return {"final_response": cover_letter}
 
+    async def acraft_coverletter(self, state: State) -> Dict[str, Any]:
+        """Async version of craft_coverletter"""
+        job_description = await self.afind_exact_job(state)
+        memory_personal = self.load_personal_memory(state)
+        return {"final_response": await self.astream_text(craft_coverletter_prompt(state["user_input"], memory_personal, job_description))}
+
     def collect_job_search_preferences(self, state: State) -> Dict[str, Any]:
         """Prompts the user to populate all required fields for the job search"""
         logger.info(">>>>> In collect_job_search_preferences")
-        response = completion(
-            model= self.model_name,
-            messages=fill_job_preferences(state["user_input"]),
-            response_format=JobSearchParams,
-        )
-        json_content = response.choices[0].message.content
+        response = self.llm.completion(fill_job_preferences(state["user_input"]), response_format=JobSearchParams)
+        return self.prefill_job_form(response.choices[0].message.content)
+
+    async def acollect_job_search_preferences(self, state: State) -> Dict[str, Any]:
+        """Async version of collect_job_search_preferences"""
+        response = await self.llm.acompletion(fill_job_preferences(state["user_input"]), response_format=JobSearchParams)
+        return self.prefill_job_form(response.choices[0].message.content)
+
+    def prefill_job_form(self, json_content: str) -> Dict[str, Any]:
+        """Prefill the job form with the search parameters the LLM extracted"""
         result = JobSearchParams.parse_raw(json_content)
         result.limit = max(AppConfig.MIN_JOBS, min(result.limit, AppConfig.MAX_JOBS))
         st.session_state.form_prefill = result
@@ -183,12 +233,21 @@ class HuntMate:
     def process_job_search_params(self, state: State) -> Dict[str, Any]:
         """Populate the job search parameters based on the user's input"""
         logger.info(">>>>> In process_job_search_params")
-        response = completion(
-            model= self.model_name,
-            messages=fill_job_preferences(state["user_input"]),
-            response_format=JobSearchParams, 
-        )
-        json_content = response.choices[0].message.content
+        if state.get("job_search_params") is not None:
+            # Already structured by the job form, no need to ask the LLM to parse them back
+            logger.info("Using the job search params of the form:\n%s", state["job_search_params"].dict())
+            return {"job_search_params": state["job_search_params"], "user_input": state["user_input"]}
+        response = self.llm.completion(fill_job_preferences(state["user_input"]), response_format=JobSearchParams)
+        return self.parsed_job_search_params(state, response.choices[0].message.content)
+
+    async def aprocess_job_search_params(self, state: State) -> Dict[str, Any]:
+        """Async version of process_job_search_params"""
+        if state.get("job_search_params") is not None:
+            return {"job_search_params": state["job_search_params"], "user_input": state["user_input"]}
+        response = await self.llm.acompletion(fill_job_preferences(state["user_input"]), response_format=JobSearchParams)
+        return self.parsed_job_search_params(state, response.choices[0].message.content)
+
+    def parsed_job_search_params(self, state: State, json_content: str) -> Dict[str, Any]:
         result = JobSearchParams.parse_raw(json_content)
         if result.locations == []:
             result.locations = ["Worldwide"]
@@ -202,18 +261,18 @@ class HuntMate:
         source_class = str(job["site"]).capitalize()  # default class if unknown
         return f""" 💼 {job['title']} [🌀 {source_class}] \n ###### **Company:** {job['company']}  \n ###### **Match Score:** {job_match.match_score}  \n ###### **Job Summary:** {job_match.job_summary}  \n ###### **Job Reasoning:** {job_match.reasonning}  \n ###### **[🔗 Link to the job posting]({job['job_posting_link']})**  \n---------------------------------\n"""
      
-    def basic_keyword_match(self, job: dict, keywords: List[str]) -> bool:
-        """Check if the job title or description contains any of the keywords"""
-        keys = [word.lower() for keyword in keywords for word in keyword.split()]
-        title = job["title"].lower()
-        description = job["job_description"].lower()
-        for keyword in keys:
-            if keyword.lower() in title or keyword.lower() in description:
-                return True
-        return False
+    def basic_keyword_match(self, jobs: List[Dict[str, str]], matcher: KeywordMatcher) -> List[Dict[str, str]]:
+        """Keep the jobs whose title or description contains any of the keywords, recording their number of keyword hits"""
+        matched_jobs = []
+        for job, hits in zip(jobs, matcher.count(jobs)):
+            if hits > 0:
+                job["keyword_hits"] = hits
+                matched_jobs.append(job)
+        return matched_jobs
 
     def remove_duplicate_jobs(self, linkedin_jobs: List[Dict[str, str]], jobspy_jobs: List[Dict[str, str]]) -> List[Dict[str, str]]:
         """ Remove duplicate jobs based on company and title edit distance """
+        import Levenshtein
 
         def is_similar(str1: str, str2: str, threshold: float = 0.6) -> bool:
             """Check if two strings are similar based on a threshold using Levenshtein ratio."""
@@ -232,110 +291,288 @@ class HuntMate:
         # Combine filtered jobspy jobs with linkedin jobs
         return filtered_jobspy + linkedin_jobs
 
+    def job_score_requests(self, state: State, jobs: List[Dict[str, str]], memory_personal: List[str]) -> Tuple[List[Optional[JobMatch]], List[int], List[List[Dict[str, str]]]]:
+        """Look the jobs up in the score store, returning the stored results, the indices of the unscored jobs and their prompts"""
+        preferences_hash = self.score_store.preferences_hash(state["job_search_params"])
+        memory_hash = self.score_store.memory_hash(memory_personal)
+        results = [self.score_store.get(job, preferences_hash, memory_hash) for job in jobs]
+        unscored = [i for i, result in enumerate(results) if result is None]
+        messages = [check_job_match(state["job_search_params"], jobs[i]["title"], jobs[i]["company"], jobs[i]["job_description"], memory_personal) for i in unscored]
+        return results, unscored, messages
+
+    def collect_job_scores(self, state: State, jobs: List[Dict[str, str]], memory_personal: List[str], results: List[Optional[JobMatch]],
+                           unscored: List[int], messages: List[List[Dict[str, str]]], responses: list) -> Tuple[List[int], List[List[Dict[str, str]]]]:
+        """Parse the LLM scores of the unscored jobs and save them in the score store.
+        Returns the indices and prompts of the jobs whose response failed or couldn't be parsed"""
+        preferences_hash = self.score_store.preferences_hash(state["job_search_params"])
+        memory_hash = self.score_store.memory_hash(memory_personal)
+        failed, failed_messages = [], []
+        for i, message, res in zip(unscored, messages, responses):
+            if isinstance(res, SearchCancelled):
+                failed.append(i)
+                failed_messages.append(message)
+                continue
+            if isinstance(res, Exception):
+                logger.error("Error scoring the job %s: %s", jobs[i]["title"], str(res))
+                result = None
+            else:
+                result = parse_job_match(res.choices[0].message.content if res.choices else None)
+            if result is None:
+                metrics.increment("scoring.failed")
+                failed.append(i)
+                failed_messages.append(message)
+                continue
+            results[i] = result
+            logger.info("Result:\n%s", results[i].dict())
+            self.score_store.put(jobs[i], preferences_hash, memory_hash, results[i])
+        return failed, failed_messages
+
+    def packed_score_requests(self, state: State, jobs: List[Dict[str, str]], memory_personal: List[str], unscored: List[int]) -> Tuple[List[List[int]], List[List[Dict[str, str]]]]:
+        """Pack the unscored jobs into requests scoring several jobs each, returning the packs (positions in unscored) and their prompts"""
+        packs = pack_jobs([jobs[i] for i in unscored])
+        messages = [check_job_matches(state["job_search_params"], [jobs[unscored[p]] for p in pack], memory_personal) for pack in packs]
+        return packs, messages
+
+    def collect_packed_scores(self, state: State, jobs: List[Dict[str, str]], memory_personal: List[str], results: List[Optional[JobMatch]],
+                              unscored: List[int], messages: List[List[Dict[str, str]]], packs: List[List[int]], responses: list) -> Tuple[List[int], List[List[Dict[str, str]]]]:
+        """Parse the results of the packed requests and save them in the score store.
+        Returns the indices and single job prompts of the jobs without a valid result, they are scored on their own"""
+        preferences_hash = self.score_store.preferences_hash(state["job_search_params"])
+        memory_hash = self.score_store.memory_hash(memory_personal)
+        failed, failed_messages = [], []
+        for pack, res in zip(packs, responses):
+            if isinstance(res, Exception):
+                if not isinstance(res, SearchCancelled):
+                    logger.error("Error scoring a pack of %s jobs: %s", len(pack), str(res))
+                matches = {}
+            else:
+                matches = parse_job_matches(res.choices[0].message.content if res.choices else None, len(pack))
+            for position, p in enumerate(pack):
+                i = unscored[p]
+                if position not in matches:
+                    metrics.increment("scoring.pack_missing")
+                    failed.append(i)
+                    failed_messages.append(messages[p])
+                    continue
+                results[i] = matches[position]
+                self.score_store.put(jobs[i], preferences_hash, memory_hash, results[i])
+        metrics.increment("scoring.packs", len(packs))
+        logger.info("Scored %s jobs in %s packed requests, %s left to score on their own", len(unscored), len(packs), len(failed))
+        return failed, failed_messages
+
+    def scored_jobs(self, jobs: List[Dict[str, str]], results: List[Optional[JobMatch]], requested: int) -> List[Tuple[Dict[str, str], JobMatch]]:
+        """Pair the jobs with their results, skipping the jobs that couldn't be scored"""
+        skipped = sum(1 for result in results if result is None)
+        if skipped:
+            metrics.increment("scoring.skipped", skipped)
+            logger.warning("Skipped %s jobs that couldn't be scored after %s attempts", skipped, AppConfig.JOB_MATCH_MAX_ATTEMPTS)
+        logger.info("Scored %s jobs, %s reused from the score store", len(jobs) - skipped, len(jobs) - requested)
+        return [(job, result) for job, result in zip(jobs, results) if result is not None]
+
+    def score_jobs(self, state: State, jobs: List[Dict[str, str]], memory_personal: List[str]) -> List[Tuple[Dict[str, str], JobMatch]]:
+        """Score a batch of jobs against the user's preferences in parallel LLM calls, retrying only the jobs that failed.
+        A cancelled search returns the jobs scored so far without waiting for the rest"""
+        results, unscored, messages = self.job_score_requests(state, jobs, memory_personal)
+        requested = len(unscored)
+        cancel_event = state.get("cancel_event")
+        if AppConfig.JOB_MATCH_PACKED and len(unscored) > 1:
+            packs, pack_messages = self.packed_score_requests(state, jobs, memory_personal, unscored)
+            responses = self.scoring_executor.map(pack_messages, response_format=JobMatchList, cancel_event=cancel_event)
+            unscored, messages = self.collect_packed_scores(state, jobs, memory_personal, results, unscored, messages, packs, responses)
+        for attempt in range(AppConfig.JOB_MATCH_MAX_ATTEMPTS):
+            if not unscored or (cancel_event is not None and cancel_event.is_set()):
+                break
+            if attempt > 0:
+                metrics.increment("scoring.retried", len(unscored))
+            responses = self.scoring_executor.map(messages, response_format=JobMatch, use_cache=attempt == 0, cancel_event=cancel_event)
+            unscored, messages = self.collect_job_scores(state, jobs, memory_personal, results, unscored, messages, responses)
+        return self.scored_jobs(jobs, results, requested)
+
+    async def ascore_jobs(self, state: State, jobs: List[Dict[str, str]], memory_personal: List[str]) -> List[Tuple[Dict[str, str], JobMatch]]:
+        """Async version of score_jobs"""
+        results, unscored, messages = self.job_score_requests(state, jobs, memory_personal)
+        requested = len(unscored)
+        cancel_event = state.get("cancel_event")
+        if AppConfig.JOB_MATCH_PACKED and len(unscored) > 1:
+            packs, pack_messages = self.packed_score_requests(state, jobs, memory_personal, unscored)
+            responses = await self.scoring_executor.amap(pack_messages, response_format=JobMatchList, cancel_event=cancel_event)
+            unscored, messages = self.collect_packed_scores(state, jobs, memory_personal, results, unscored, messages, packs, responses)
+        for attempt in range(AppConfig.JOB_MATCH_MAX_ATTEMPTS):
+            if not unscored or (cancel_event is not None and cancel_event.is_set()):
+                break
+            if attempt > 0:
+                metrics.increment("scoring.retried", len(unscored))
+            responses = await self.scoring_executor.amap(messages, response_format=JobMatch, use_cache=attempt == 0, cancel_event=cancel_event)
+            unscored, messages = self.collect_job_scores(state, jobs, memory_personal, results, unscored, messages, responses)
+        return self.scored_jobs(jobs, results, requested)
+
+    def scrape_in_background(self, state: State, stop_event: threading.Event, put: Callable[[Optional[List[Dict[str, str]]]], None]) -> None:
+        """Run the job scrapers in a background thread, passing each scraped chunk of jobs to put (None marks the end)"""
+        def producer():
+            try:
+                for jobs in self.jobspy_tool.job_search_stream(state["job_search_params"], state["selected_websites"], state["chat"].seen_jobs, stop_event):
+                    put(jobs)
+                    if stop_event.is_set():
+                        break
+            except Exception as e:
+                logger.error("Error while scraping jobs: %s", str(e))
+            finally:
+                put(None)
+
+        threading.Thread(target=producer, name="huntmate-scraper", daemon=True).start()
+
+    def queue_scraped_jobs(self, search: ScoringQueue, jobs: Optional[List[Dict[str, str]]], start_time: float) -> bool:
+        """Queue a scraped chunk of jobs for scoring, returning whether the scrapers are still running"""
+        if jobs is None:
+            logger.info("Time taken for job search: %s", time.time() - start_time)
+            return False
+        search.add(self.basic_keyword_match(jobs, search.matcher))
+        get_stream_writer()({"progress": search.progress()})
+        return True
+
+    def emit_job_matches(self, search: ScoringQueue, scored_jobs: List[Tuple[Dict[str, str], JobMatch]]) -> None:
+        """Write the strong matches of a scored batch to the workflow's custom stream, so they can be shown before the search ends"""
+        write = get_stream_writer()
+        for job, result in scored_jobs:
+            if result.match_score >= STRONG_MATCH_SCORE:
+                write({"job": job, "job_match": result})
+        write({"progress": search.progress()})
+
+    def log_scoring_prefix(self, state: State, memory_personal: List[str]) -> None:
+        """Log the estimated size of the prefix shared by the scoring prompts of a search, the provider only caches it above a minimum"""
+        tokens = len(json.dumps(job_match_context(state["job_search_params"], memory_personal))) // AppConfig.LLM_CHARS_PER_TOKEN
+        if tokens < AppConfig.LLM_PROMPT_CACHE_MIN_TOKENS:
+            logger.info("Scoring prompt prefix of about %s tokens, below the %s tokens the provider caches", tokens, AppConfig.LLM_PROMPT_CACHE_MIN_TOKENS)
+        else:
+            logger.info("Scoring prompt prefix of about %s tokens, cacheable by the provider", tokens)
+
     def find_related_jobs(self, state: State) -> Dict[str, Any]:
-        """Find related jobs based on the user's input"""
-        counter, i = 1, 0
+        """Find related jobs based on the user's input, scoring jobs while the scrapers are still running"""
         start_time = time.time()
-        score_answer = {"1":[], "2":[],"3": [], "4": [], "5": []}
-        
-
-        
-        linkedin_jobs, jobspy_jobs = [], []
 
         if state["selected_websites"] == []:
             state["selected_websites"] = ["indeed", "google", "glassdoor", "linkedin"]
         
         # if "LinkedIn" in state["selected_websites"]:
-            # linkedin_jobs = self.linkedin_tool.job_search(state["job_search_params"])
+            # linkedin_jobs = self.linkedin_tool.job_search(state["job_search_params"], state["chat"].seen_jobs)
             # if len(state["selected_websites"]) > 1:
             #     state["selected_websites"].remove("LinkedIn")
-        
-        jobspy_jobs = self.jobspy_tool.job_search(state["job_search_params"], state["selected_websites"])
-        found_jobs = jobspy_jobs
-        # found_jobs = self.remove_duplicate_jobs(linkedin_jobs, jobspy_jobs)
-
-        found_jobs = [job for job in found_jobs if self.basic_keyword_match(job, state["job_search_params"].job_keywords)]
-        mid_time = time.time()
-        logger.info("Time taken for job search (mid - start): %s", mid_time - start_time)
-        logger.info("Found jobs: %s", len(found_jobs))
-        
-        batch_size = AppConfig.JOB_MATCH_BATCH_SIZE
-        while counter < state["job_search_params"].limit + 1 and  i < len(found_jobs): 
-            logger.info("Processing job: %s", i)
-            messages = [check_job_match(state["job_search_params"], job["title"], job["company"], job["job_description"], self.load_personal_memory(state)) for job in found_jobs[i:i+batch_size]]
-            responses = batch_completion(
-                model= self.model_name,
-                messages=messages,
-                response_format=JobMatch,
-            )
-            for res in responses:
-                json_content = res.choices[0].message.content
-                result = JobMatch.parse_raw(json_content)
-                logger.info("Result:\n%s", result.dict())
-                score_answer[str(result.match_score)].append((found_jobs[i], result))
-                if result.match_score > 3:
-                    counter += 1
-                i += 1
+
+        stop_event = threading.Event()
+        cancel_event = state.get("cancel_event") or threading.Event()
+        jobs_queue = queue.Queue()
+        self.scrape_in_background(state, stop_event, jobs_queue.put)
+        memory_personal = self.load_personal_memory(state)
+        self.log_scoring_prefix(state, memory_personal)
+        search = ScoringQueue(state["job_search_params"])
+        scraping = True
+        try:
+            while not search.is_done(scraping) and not cancel_event.is_set():
+                if scraping:
+                    # Drain every chunk that is already scraped, and only wait for the scrapers when there is nothing to score
+                    try:
+                        jobs = jobs_queue.get(block=not search.pending, timeout=AppConfig.SEARCH_CANCEL_POLL)
+                    except queue.Empty:
+                        if not search.pending:
+                            continue
+                    else:
+                        scraping = self.queue_scraped_jobs(search, jobs, start_time)
+                        continue
+                scored_jobs = self.score_jobs(state, search.next_batch(), memory_personal)
+                search.record(scored_jobs)
+                self.emit_job_matches(search, scored_jobs)
+        finally:
+            stop_event.set()
+        return self.job_search_answer(state, search, start_time, cancel_event.is_set())
+
+    async def afind_related_jobs(self, state: State) -> Dict[str, Any]:
+        """Async version of find_related_jobs, the scrapers hand their jobs over to the event loop"""
+        start_time = time.time()
+
+        if state["selected_websites"] == []:
+            state["selected_websites"] = ["indeed", "google", "glassdoor", "linkedin"]
+
+        loop = asyncio.get_running_loop()
+        jobs_queue = asyncio.Queue()
+
+        def put(jobs: Optional[List[Dict[str, str]]]) -> None:
+            try:
+                loop.call_soon_threadsafe(jobs_queue.put_nowait, jobs)
+            except RuntimeError:
+                pass  # The event loop is already closed, nobody is waiting for these jobs anymore
+
+        stop_event = threading.Event()
+        cancel_event = state.get("cancel_event") or threading.Event()
+        self.scrape_in_background(state, stop_event, put)
+        memory_personal = self.load_personal_memory(state)
+        self.log_scoring_prefix(state, memory_personal)
+        search = ScoringQueue(state["job_search_params"])
+        scraping = True
+        try:
+            while not search.is_done(scraping) and not cancel_event.is_set():
+                if scraping and (not jobs_queue.empty() or not search.pending):
+                    try:
+                        jobs = await asyncio.wait_for(jobs_queue.get(), AppConfig.SEARCH_CANCEL_POLL)
+                    except TimeoutError:
+                        continue
+                    scraping = self.queue_scraped_jobs(search, jobs, start_time)
+                    continue
+                scored_jobs = await self.ascore_jobs(state, search.next_batch(), memory_personal)
+                search.record(scored_jobs)
+                self.emit_job_matches(search, scored_jobs)
+        finally:
+            stop_event.set()
+        return self.job_search_answer(state, search, start_time, cancel_event.is_set())
+
+    def job_search_answer(self, state: State, search: ScoringQueue, start_time: float, cancelled: bool = False) -> Dict[str, Any]:
+        """Format the best scored jobs of a search as the final response"""
+        logger.info("Found jobs: %s, cancelled: %s", search.found, cancelled)
+        logger.info("LLM prompt tokens so far: %s, %s of them read from the provider's prompt cache",
+                    metrics.get("llm.prompt_tokens"), metrics.get("llm.cached_tokens"))
+        logger.info("LLM latency by model and kind of request: %s, %s requests hedged, %s hedges refused by the rate limits",
+                    self.llm.latency_summary(), metrics.get("llm.hedged"), metrics.get("llm.hedges_refused"))
+        score_answer = search.score_answer
 
         answer = f"""### 🔍 Here are the list of jobs I found based on your preferences:\n"""
         if len(score_answer["5"]) == 0 and len(score_answer["4"]) == 0:
             if len(score_answer["3"]) == 0 and len(score_answer["2"]) == 0 and len(score_answer["1"]) == 0:
+                if cancelled:
+                    return {"final_response": "The job search was cancelled before any job was scored."}
                 return {"final_response": "I couldn't find any job matches for you. Please try a more general list of job keywords or location. Also increase the limit value to get more jobs."}
             else:
                 answer = f"### 🔍  I couldn't find a good job match for you. Here are a list of moderate job fits:\n"
 
-        counter = 1
-        for i in range(5, 0, -1):
-            for job, result in score_answer[str(i)]:
-                answer += self.job_details_output(job, result)    
-                counter += 1
-                if counter > state["job_search_params"].limit + AppConfig.EXTRA_JOBS_TO_SEARCH_LOWER:
-                    return {"final_response": answer}
+        shown_jobs = [scored_job for i in range(5, 0, -1) for scored_job in score_answer[str(i)]]
+        shown_jobs = shown_jobs[:state["job_search_params"].limit + AppConfig.EXTRA_JOBS_TO_SEARCH_LOWER]
+        if cancelled:
+            answer = "*The job search was cancelled, these are the jobs scored before it stopped.*\n" + answer
+        for job, result in shown_jobs:
+            answer += self.job_details_output(job, result)
+        state["chat"].job_index.record(shown_jobs)
+        # Only the jobs shown to the user are seen, the ones scraped but never scored or shown can come up in a later search
+        state["chat"].seen_jobs.add(job["job_id"] for job, _ in shown_jobs)
         end_time = time.time()
         logger.info("Main function time (end - start): %s", end_time - start_time)
-        logger.info("Main function time (end - mid): %s", end_time - mid_time)
         return {"final_response": answer}
 
     def unsupported_task(self, state: State) -> Dict[str, Any]:
         """Return a response for an unsupported task"""
-        chat_history = []
-        if os.path.exists("db/chat_history.csv"):
-            chat_history = pd.read_csv("db/chat_history.csv")["chat_history"].tolist()
-        response = completion(
-            model=self.model_name,
-            messages=unsupported_task_prompt(state["user_input"], chat_history),
-            response_format=None
-        )
-        return {"final_response": response.choices[0].message.content}
+        chat_history = state["chat"].memory.chat_history(AppConfig.CHAT_HISTORY_CONTEXT)
+        return {"final_response": self.stream_text(unsupported_task_prompt(state["user_input"], chat_history))}
+
+    async def aunsupported_task(self, state: State) -> Dict[str, Any]:
+        """Async version of unsupported_task"""
+        chat_history = state["chat"].memory.chat_history(AppConfig.CHAT_HISTORY_CONTEXT)
+        return {"final_response": await self.astream_text(unsupported_task_prompt(state["user_input"], chat_history))}
         
     def update_memory(self, state: State) -> None:
-        """Save memory and chat history to CSV files."""
-        user_info_memory_path = "db/user_info_memory.csv"
+        """Save memory and chat history, the session memory writes them to the store in the background."""
         if len(state.get("information_to_memorize", [])) > 0:
-            # Load existing data if the file exists
-            if os.path.exists(user_info_memory_path):
-                existing_data = pd.read_csv(user_info_memory_path)
-            else:
-                existing_data = pd.DataFrame(columns=["Information"])
-
-            new_data = pd.DataFrame(state["information_to_memorize"], columns=["Information"])
-            updated_data = pd.concat([existing_data, new_data], ignore_index=True)
-            updated_data.to_csv(user_info_memory_path, index=False)
-
-        # Save user_input and final_response to chat_history.csv
-        chat_history_path = "db/chat_history.csv"
-        new_data = pd.DataFrame({
-            "chat_history": [state.get("user_input", ""), state.get("final_response", "")]
-        })
-        if os.path.exists(chat_history_path):
-            existing_data = pd.read_csv(chat_history_path)
-        else:
-            existing_data = pd.DataFrame(columns=["chat_history"])
-
-        updated_data = pd.concat([existing_data, new_data], ignore_index=True)
-        updated_data.to_csv(chat_history_path, index=False)
+            state["chat"].memory.add_memory(state["information_to_memorize"])
+        state["chat"].memory.add_chat_messages([state.get("user_input", ""), state.get("final_response", "")])
 
     def save_diagram(self, path) -> None:
+        from langchain_core.runnables.graph import MermaidDrawMethod
         with open(path, "wb") as f:
             f.write(
             self.workflow.get_graph().draw_mermaid_png(
@@ -347,14 +584,14 @@ class HuntMate:
 
         self.workflow = StateGraph(State)
 
-        # Add nodes
-        self.workflow.add_node("main_task_router", self.main_task_router)
-        self.workflow.add_node("craft_email", self.craft_email)
-        self.workflow.add_node("unsupported_task", self.unsupported_task)
-        self.workflow.add_node("craft_coverletter", self.craft_coverletter)
-        self.workflow.add_node("collect_job_search_preferences", self.collect_job_search_preferences)
-        self.workflow.add_node("process_job_search_params", self.process_job_search_params)
-        self.workflow.add_node("find_related_jobs", self.find_related_jobs)
+        # Add nodes, invoke runs their sync version and ainvoke their async version
+        self.workflow.add_node("main_task_router", RunnableLambda(self.main_task_router, afunc=self.amain_task_router))
+        self.workflow.add_node("craft_email", RunnableLambda(self.craft_email, afunc=self.acraft_email))
+        self.workflow.add_node("unsupported_task", RunnableLambda(self.unsupported_task, afunc=self.aunsupported_task))
+        self.workflow.add_node("craft_coverletter", RunnableLambda(self.craft_coverletter, afunc=self.acraft_coverletter))
+        self.workflow.add_node("collect_job_search_preferences", RunnableLambda(self.collect_job_search_preferences, afunc=self.acollect_job_search_preferences))
+        self.workflow.add_node("process_job_search_params", RunnableLambda(self.process_job_search_params, afunc=self.aprocess_job_search_params))
+        self.workflow.add_node("find_related_jobs", RunnableLambda(self.find_related_jobs, afunc=self.afind_related_jobs))
         self.workflow.add_node("update_memory", self.update_memory)
 
         # Add edges
@@ -383,13 +620,42 @@ class HuntMate:
         # self.save_diagram("./images/diagram.png")
         return 
 
-    def run(self, user_input: str, skip_router: bool = True, filled_job_form: bool = False, websites: List[str] = []) -> str:
-        """Run the HuntMate to generate the response"""
-        response = self.workflow.invoke({"user_input": user_input, 
-                                         "skip_router": skip_router, 
-                                         "filled_job_form": filled_job_form, 
-                                         "selected_websites": websites})["final_response"]
+    def workflow_input(self, user_input: str, skip_router: bool, filled_job_form: bool, websites: List[str], job_search_params: Optional[JobSearchParams],
+                       chat: Optional[ChatSession], cancel_event: Optional[threading.Event] = None) -> Dict[str, Any]:
+        return {"user_input": user_input, 
+                "chat": chat or self.default_chat,
+                "skip_router": skip_router, 
+                "filled_job_form": filled_job_form, 
+                "selected_websites": websites,
+                "job_search_params": job_search_params,
+                "cancel_event": cancel_event}
+
+    def run(self, user_input: str, skip_router: bool = True, filled_job_form: bool = False, websites: List[str] = [], job_search_params: Optional[JobSearchParams] = None,
+            chat: Optional[ChatSession] = None) -> str:
+        """Run the HuntMate to generate the response, job_search_params skips parsing the filled job form with the LLM.
+        chat holds the user's memory and jobs, callers serving several users pass one per user"""
+        response = self.workflow.invoke(self.workflow_input(user_input, skip_router, filled_job_form, websites, job_search_params, chat))["final_response"]
         return response
+
+    def run_stream(self, user_input: str, skip_router: bool = True, filled_job_form: bool = False, websites: List[str] = [], job_search_params: Optional[JobSearchParams] = None,
+                   chat: Optional[ChatSession] = None, cancel_event: Optional[threading.Event] = None) -> Iterator[Dict[str, Any]]:
+        """Run the HuntMate, yielding {"token": ...} events while a text response is generated, {"job": ..., "job_match": ...} events
+        for each strong match and {"progress": ...} events while a job search runs, and {"final_response": ...} at the end.
+        Setting cancel_event stops a job search, keeping the jobs scored so far"""
+        final_response = None
+        for mode, chunk in self.workflow.stream(self.workflow_input(user_input, skip_router, filled_job_form, websites, job_search_params, chat, cancel_event),
+                                                stream_mode=["custom", "values"]):
+            if mode == "custom":
+                yield chunk
+            else:
+                final_response = chunk.get("final_response")
+        yield {"final_response": final_response}
+
+    async def arun(self, user_input: str, skip_router: bool = True, filled_job_form: bool = False, websites: List[str] = [], job_search_params: Optional[JobSearchParams] = None,
+                   chat: Optional[ChatSession] = None) -> str:
+        """Async version of run, many conversations can be served concurrently from one event loop, each with its own chat"""
+        result = await self.workflow.ainvoke(self.workflow_input(user_input, skip_router, filled_job_form, websites, job_search_params, chat))
+        return result["final_response"]
     
 
 
@@ -0,0 +1,110 @@
+from typing import Optional, Tuple
+from collections import Counter, deque
+import threading
+import logging
+import math
+import re
+
+from src.llm_client import LLMClient
+from src.models import Route
+from src.prompts import router_prompt
+from src.settings import AppConfig
+from src.metrics import metrics
+
+
+logger = logging.getLogger(__name__)
+
+# Messages that may hold a general preference or personal information, which only the LLM can extract for the memory
+MEMORY_PATTERN = re.compile(r"\b(always|never|only|remember|prefer|i am|i'm a|i'm an|my name|i have \d+|years of experience)\b", re.IGNORECASE)
+# Questions and requests for advice are left to the LLM, the rules only route imperative requests
+QUESTION_PATTERN = re.compile(r"\?|^\s*(how|what|why|which|when|where|who|should|can|could|would|do|does|is|are)\b|\b(tips?|advice|how\s+to)\b", re.IGNORECASE)
+# A request verb at the start, then at most a few words before the noun, e.g. "find remote data science jobs in Berlin"
+REQUEST = r"^\s*(please\s+)?"
+GAP = r"(\s+[\w'/+#.-]+){0,5}?\s+"
+ROUTE_PATTERNS = {
+    "craft_coverletter": re.compile(REQUEST + r"((write|draft|compose|craft|prepare|create|generate)\b" + GAP + r"|(an?\s+)?)cover\s*-?\s*letters?\b", re.IGNORECASE),
+    "craft_email": re.compile(REQUEST + r"((write|draft|compose|craft|prepare)\b" + GAP + r"(e-?mails?|messages?|notes?)\b|(an?\s+)?(e-?mail|message)\s+(to|for)\b)", re.IGNORECASE),
+    "job_search": re.compile(REQUEST + r"(find|search(\s+for)?|look(ing)?\s+for)\b" + GAP + r"(jobs?|positions?|roles?|openings?|internships?|vacancies)\b"
+                             r"(?!\s+(offers?|interviews?|applications?|descriptions?|titles?|market)\b)|^\s*job\s+search\b", re.IGNORECASE),
+    "unsupported_task": re.compile(r"^\s*(hi+|hello|hey|hiya|good\s+(morning|afternoon|evening)|thanks?(\s+you)?|thank\s+you|ok(ay)?|bye)\b[\s!.,?]*(there|huntmate)?[\s!.,?]*$", re.IGNORECASE),
+}
+WORD_PATTERN = re.compile(r"[a-z0-9']+")
+
+
+def bag_of_words(text: str) -> Counter:
+    return Counter(WORD_PATTERN.findall(text.lower()))
+
+
+def cosine_similarity(a: Counter, b: Counter) -> float:
+    dot = sum(count * b[word] for word, count in a.items())
+    norm = math.sqrt(sum(v * v for v in a.values())) * math.sqrt(sum(v * v for v in b.values()))
+    return dot / norm if norm else 0.0
+
+
+# Routes user messages with rules first, then past decisions, and only then the LLM
+class IntentRouter:
+    def __init__(self, llm: LLMClient) -> None:
+        self.llm = llm
+        self._lock = threading.Lock()
+        self._decisions = deque(maxlen=AppConfig.ROUTER_CACHE_SIZE)  # (bag of words, route) of past LLM decisions
+
+    def route_by_rules(self, user_input: str) -> Optional[Route]:
+        """Route obvious requests with keyword rules, giving up when more than one route matches"""
+        if MEMORY_PATTERN.search(user_input):
+            return None
+        routes = [route for route, pattern in ROUTE_PATTERNS.items() if pattern.search(user_input)]
+        if QUESTION_PATTERN.search(user_input) and routes != ["unsupported_task"]:
+            return None
+        if len(routes) != 1:
+            return None
+        return Route(route=routes[0])
+
+    def route_by_cache(self, user_input: str) -> Optional[Route]:
+        """Reuse the LLM decision of a previous message that is almost the same"""
+        words = bag_of_words(user_input)
+        with self._lock:
+            best_similarity, best_route = 0.0, None
+            for past_words, route in self._decisions:
+                similarity = cosine_similarity(words, past_words)
+                if similarity > best_similarity:
+                    best_similarity, best_route = similarity, route
+        if best_similarity >= AppConfig.ROUTER_CACHE_MIN_SIMILARITY:
+            return Route(route=best_route)
+        return None
+
+    def remember_decision(self, user_input: str, decision: Route) -> None:
+        # Decisions that extracted memory are specific to their message, only plain routing decisions are reused
+        if not decision.information_to_memorize and not MEMORY_PATTERN.search(user_input):
+            with self._lock:
+                self._decisions.append((bag_of_words(user_input), decision.route))
+
+    def route_without_llm(self, user_input: str) -> Tuple[Optional[Route], str]:
+        for tier, router in (("rules", self.route_by_rules), ("cache", self.route_by_cache)):
+            decision = router(user_input)
+            if decision is not None:
+                return decision, tier
+        return None, "llm"
+
+    def log_decision(self, decision: Route, tier: str) -> None:
+        metrics.increment(f"router.{tier}")
+        logger.info("Router tier %s chose %s", tier, decision.route)
+
+    def route(self, user_input: str) -> Tuple[Route, str]:
+        """Return the routing decision and the tier that made it ("rules", "cache" or "llm")"""
+        decision, tier = self.route_without_llm(user_input)
+        if decision is None:
+            response = self.llm.completion(router_prompt(user_input), response_format=Route)
+            decision = Route.parse_raw(response.choices[0].message.content)
+            self.remember_decision(user_input, decision)
+        self.log_decision(decision, tier)
+        return decision, tier
+
+    async def aroute(self, user_input: str) -> Tuple[Route, str]:
+        """Async version of route"""
+        decision, tier = self.route_without_llm(user_input)
+        if decision is None:
+            response = await self.llm.acompletion(router_prompt(user_input), response_format=Route)
+            decision = Route.parse_raw(response.choices[0].message.content)
+            self.remember_decision(user_input, decision)
+        self.log_decision(decision, tier)
+        return decision, tier
@@ -0,0 +1,127 @@
+from urllib.parse import urlsplit, parse_qsl, urlencode
+from rapidfuzz import fuzz
+from typing import List, Dict, Optional, Tuple
+import threading
+import logging
+import re
+
+from src.models import JobMatch
+from src.settings import AppConfig
+from src.metrics import metrics
+
+
+logger = logging.getLogger(__name__)
+
+URL_PATTERN = re.compile(r"https?://[^\s)\]>\"']+")
+ORDINALS = {"first": 1, "second": 2, "third": 3, "fourth": 4, "fifth": 5, "sixth": 6, "seventh": 7, "eighth": 8, "ninth": 9, "tenth": 10}
+ORDINAL_PATTERN = re.compile(
+    r"\b(?:(?P<word>" + "|".join(ORDINALS) + r"|last)\s+(?:one|job|position|role|posting|opening)"
+    r"|(?P<number>\d{1,2})(?:st|nd|rd|th)\s+(?:one|job|position|role|posting|opening)"
+    r"|(?:job|number|no\.?|option)\s*#?\s*(?P<index>\d{1,2})\b"
+    r"|#(?P<hash>\d{1,2})\b)",
+    re.IGNORECASE,
+)
+# Query parameters that only track where a link was clicked, the others (Indeed's jk, Glassdoor's jl, ...) identify the job
+TRACKING_PARAMS = {"from", "vjs", "tk", "trk", "trackingid", "refid", "ref", "src", "ao", "pos", "guid", "cs", "cb"}
+# A message naming a company ("... at Umbrella Corp") or reading like a pasted posting is about a job that may not be in the index
+COMPANY_PATTERN = re.compile(r"\bat\s+([A-Z][\w&.'-]*(?:\s+[A-Z][\w&.'-]*)*)")
+DESCRIPTION_PATTERN = re.compile(r"\b(we are hiring|we're hiring|we are looking for|we're looking for|responsibilities|requirements|qualifications|about the role|about us)\b", re.IGNORECASE)
+
+
+def canonical_url(url: str) -> str:
+    """Lowercase host and path without the fragment, the tracking parameters and a trailing slash, keeping the parameters identifying the job"""
+    parts = urlsplit(str(url).strip())
+    host = parts.netloc.lower().removeprefix("www.")
+    query = sorted((key, value) for key, value in parse_qsl(parts.query) if key.lower() not in TRACKING_PARAMS and not key.lower().startswith("utm_"))
+    return f"{host}{parts.path.rstrip('/').lower()}" + (f"?{urlencode(query)}" if query else "")
+
+
+# Jobs shown to the user in this session, used to find which job a message is about without asking the LLM
+class SessionJobIndex:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.jobs: Dict[str, Dict[str, str]] = {}    # All the jobs shown in this session, by job id
+        self.links: Dict[str, str] = {}              # Job id of each canonical link
+        self.last_results: List[Dict[str, str]] = [] # The jobs of the last search, in the order they were shown
+
+    def record(self, shown_jobs: List[Tuple[Dict[str, str], JobMatch]]) -> None:
+        """Remember the jobs of a search result, in display order"""
+        with self._lock:
+            self.last_results = [job for job, _ in shown_jobs]
+            for job in self.last_results:
+                self.jobs[str(job["job_id"])] = job
+                self.links[canonical_url(job["job_posting_link"])] = str(job["job_id"])
+
+    def by_link_or_id(self, text: str) -> Optional[Dict[str, str]]:
+        for url in URL_PATTERN.findall(text):
+            job_id = self.links.get(canonical_url(url))
+            if job_id is not None:
+                return self.jobs[job_id]
+        for job_id, job in self.jobs.items():
+            if len(job_id) > 4 and job_id in text:
+                return job
+        return None
+
+    def mentions_unknown_job(self, text: str) -> bool:
+        """Whether the message has a link that is not in the index, reads like a pasted job description or names another
+        company. A fuzzy title match would then pick a shown job instead of the one the user means"""
+        if any(canonical_url(url) not in self.links for url in URL_PATTERN.findall(text)):
+            return True
+        if len(text) > AppConfig.JOB_MENTION_MAX_LENGTH or DESCRIPTION_PATTERN.search(text):
+            return True
+        companies = [str(job["company"]).lower() for job in self.jobs.values()]
+        for name in COMPANY_PATTERN.findall(text):
+            name = name.lower()
+            if not any(company and (company in name or name in company) for company in companies):
+                return True
+        return False
+
+    def by_position(self, text: str) -> Optional[Dict[str, str]]:
+        """Resolve mentions such as "the second one", "3rd job" or "job #4" against the last search result"""
+        match = ORDINAL_PATTERN.search(text)
+        if match is None or not self.last_results:
+            return None
+        if match.group("word"):
+            word = match.group("word").lower()
+            position = len(self.last_results) if word == "last" else ORDINALS[word]
+        else:
+            position = int(match.group("number") or match.group("index") or match.group("hash"))
+        if 1 <= position <= len(self.last_results):
+            return self.last_results[position - 1]
+        return None
+
+    def by_title_or_company(self, text: str) -> Optional[Dict[str, str]]:
+        """Fuzzy match the job title and company name, only when a single job clearly stands out"""
+        text = text.lower()
+        scored = []
+        for job in self.jobs.values():
+            title_score = fuzz.partial_ratio(str(job["title"]).lower(), text)
+            company = str(job["company"]).lower()
+            company_mentioned = len(company) >= 3 and re.search(r"(?<!\w)" + re.escape(company) + r"(?!\w)", text) is not None
+            score = title_score + (AppConfig.JOB_MENTION_COMPANY_BONUS if company_mentioned else 0)
+            scored.append((score, job))
+        scored.sort(key=lambda item: item[0], reverse=True)
+        if not scored or scored[0][0] < AppConfig.JOB_MENTION_MIN_SCORE:
+            return None
+        if len(scored) > 1 and scored[0][0] - scored[1][0] < AppConfig.JOB_MENTION_MIN_MARGIN:
+            return None
+        return scored[0][1]
+
+    def resolve(self, text: str) -> Optional[Dict[str, str]]:
+        """The job the user is talking about, or None when it is missing or ambiguous"""
+        with self._lock:
+            resolvers = [self.by_link_or_id, self.by_position]
+            if not self.mentions_unknown_job(text):
+                resolvers.append(self.by_title_or_company)
+            for resolver in resolvers:
+                job = resolver(text)
+                if job is not None:
+                    metrics.increment(f"job_index.{resolver.__name__}")
+                    return job
+        return None
+
+    @staticmethod
+    def describe(job: Dict[str, str]) -> str:
+        """All the details of a job, with its full description"""
+        return (f"Job Title: {job['title']}\nCompany: {job['company']}\nLocation: {job['location']}\n"
+                f"Link: {job['job_posting_link']}\nJob Description: {job['job_description']}")
@@ -0,0 +1,39 @@
+from typing import Dict, List
+import threading
+import bisect
+import math
+
+
+class LatencyHistogram:
+    """Thread-safe histogram of request latencies, with logarithmic buckets from 10 ms to about 5 minutes"""
+
+    MIN_SECONDS = 0.01
+    GROWTH = 1.2  # Each bucket is 20% wider than the previous one, so percentiles are within 20% of the true value
+    BUCKETS = 58
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._bounds: List[float] = [self.MIN_SECONDS * self.GROWTH ** i for i in range(self.BUCKETS)]
+        self._counts = [0] * (self.BUCKETS + 1)
+        self.count = 0
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._counts[bisect.bisect_left(self._bounds, seconds)] += 1
+            self.count += 1
+
+    def percentile(self, percent: float) -> float:
+        """Upper bound of the bucket holding the given percentile, 0 when nothing was recorded"""
+        with self._lock:
+            if self.count == 0:
+                return 0.0
+            rank = math.ceil(self.count * percent / 100)
+            seen = 0
+            for i, count in enumerate(self._counts):
+                seen += count
+                if seen >= rank:
+                    return self._bounds[min(i, self.BUCKETS - 1)]
+            return self._bounds[-1]
+
+    def summary(self) -> Dict[str, float]:
+        return {"count": self.count, "p50": self.percentile(50), "p90": self.percentile(90), "p99": self.percentile(99)}
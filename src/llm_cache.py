@@ -0,0 +1,95 @@
+from litellm import ModelResponse
+from typing import List, Dict, Optional, Any
+import threading
+import hashlib
+import logging
+import sqlite3
+import json
+import time
+import os
+
+from src.settings import AppConfig
+from src.metrics import metrics
+
+
+logger = logging.getLogger(__name__)
+
+# Persistent, content-addressed cache for LLM completions
+class CompletionCache:
+    def __init__(self, path: str = AppConfig.LLM_CACHE_PATH, ttl: float = AppConfig.LLM_CACHE_TTL, max_bytes: int = AppConfig.LLM_CACHE_MAX_BYTES) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS completions (
+                key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )""")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS completions_accessed_at ON completions (accessed_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS completions_created_at ON completions (created_at)")
+        self._conn.commit()
+        # Running total of the stored sizes, so put doesn't sum the whole table
+        self._size = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM completions").fetchone()[0]
+        # Access times of the hits, written with the next put instead of a commit per hit
+        self._accessed: Dict[str, float] = {}
+
+    @staticmethod
+    def make_key(model: str, messages: List[Dict[str, str]], response_format: Any = None) -> str:
+        """Hash the model, the messages and the response format schema into a cache key"""
+        schema = None
+        if response_format is not None:
+            schema = response_format.model_json_schema() if hasattr(response_format, "model_json_schema") else response_format
+        payload = json.dumps({"model": model, "messages": messages, "response_format": schema}, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[ModelResponse]:
+        """Return the cached response, or None if it is missing or expired"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT response, created_at FROM completions WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                # Expired entries are deleted by the next put
+                metrics.increment("llm_cache.miss")
+                return None
+            self._accessed[key] = now
+        metrics.increment("llm_cache.hit")
+        return ModelResponse(**json.loads(row[0]))
+
+    def put(self, key: str, response: ModelResponse) -> None:
+        """Store a response and evict the least recently used entries if the cache is over its size limit"""
+        content = response.choices[0].message.content if response.choices else None
+        if not content:
+            return
+        data = response.model_dump_json()
+        now = time.time()
+        with self._lock:
+            if self._accessed:
+                self._conn.executemany("UPDATE completions SET accessed_at = ? WHERE key = ?",
+                                       [(accessed_at, old_key) for old_key, accessed_at in self._accessed.items()])
+                self._accessed.clear()
+            replaced = self._conn.execute("SELECT size FROM completions WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO completions (key, response, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, data, len(data), now, now),
+            )
+            self._size += len(data) - (replaced[0] if replaced else 0)
+            expired = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM completions WHERE created_at < ?", (now - self.ttl,)).fetchone()[0]
+            if expired:
+                self._conn.execute("DELETE FROM completions WHERE created_at < ?", (now - self.ttl,))
+                self._size -= expired
+            if self._size > self.max_bytes:
+                evicted = 0
+                for old_key, size in self._conn.execute("SELECT key, size FROM completions ORDER BY accessed_at").fetchall():
+                    if self._size <= self.max_bytes:
+                        break
+                    self._conn.execute("DELETE FROM completions WHERE key = ?", (old_key,))
+                    self._size -= size
+                    evicted += 1
+                metrics.increment("llm_cache.evicted", evicted)
+            self._conn.commit()
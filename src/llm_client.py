@@ -0,0 +1,269 @@
+from litellm import completion, acompletion, stream_chunk_builder, ModelResponse
+from litellm import RateLimitError
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import List, Dict, Optional, Any, Iterator, AsyncIterator, Callable, Tuple
+import threading
+import asyncio
+import logging
+import time
+
+from src.llm_cache import CompletionCache
+from src.latency import LatencyHistogram
+from src.settings import AppConfig
+from src.metrics import metrics
+
+
+logger = logging.getLogger(__name__)
+
+
+def record_usage(response: ModelResponse) -> None:
+    """Count the prompt tokens of a response, and how many of them the provider read from its prompt cache"""
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return
+    metrics.increment("llm.prompt_tokens", usage.prompt_tokens or 0)
+    metrics.increment("llm.completion_tokens", usage.completion_tokens or 0)
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached_tokens = getattr(details, "cached_tokens", None) or 0
+    metrics.increment("llm.cached_tokens", cached_tokens)
+
+
+def call_kind(response_format: Any) -> str:
+    """Kind of a request for its latency histogram, a packed scoring request is much slower than a single job or a routing one"""
+    if response_format is None:
+        return "text"
+    return getattr(response_format, "__name__", str(response_format))
+
+
+# Reserves room for a hedged duplicate in the caller's limits, returning the callback to run with its response and
+# whether it was throttled, or None when there is no room for it
+HedgeAdmission = Callable[[List[Dict[str, str]]], Optional[Callable[[Optional[ModelResponse], bool], None]]]
+# Run with the response of a call (None when it failed) and whether it was throttled, once its primary request is done
+SettleCallback = Callable[[Optional[ModelResponse], bool], None]
+
+# Single entry point for all LLM calls made by HuntMate
+class LLMClient:
+    def __init__(self, model_name: str, cache: Optional[CompletionCache] = None, fallback_model: Optional[str] = AppConfig.LLM_FALLBACK_MODEL) -> None:
+        self.model_name = model_name
+        self.cache = cache
+        self.fallback_model = fallback_model
+        self.latency: Dict[Tuple[str, str], LatencyHistogram] = {}  # By model and kind of request
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._hedges = 0
+        self.pool = ThreadPoolExecutor(max_workers=2 * AppConfig.LLM_CONCURRENCY_MAX, thread_name_prefix="huntmate-llm-call")
+
+    def completion(self, messages: List[Dict[str, str]], response_format: Any = None) -> ModelResponse:
+        """Run one completion, answering from the cache when the same request was seen before"""
+        cached = self.cached(messages, response_format)
+        if cached is not None:
+            return cached
+        return self.call(messages, response_format)
+
+    def cached(self, messages: List[Dict[str, str]], response_format: Any = None) -> Optional[ModelResponse]:
+        """Cached response of a request, if there is one"""
+        if self.cache is None:
+            return None
+        return self.cache.get(self.cache.make_key(self.model_name, messages, response_format))
+
+    def call(self, messages: List[Dict[str, str]], response_format: Any = None, admit_hedge: Optional[HedgeAdmission] = None,
+             on_settled: Optional[SettleCallback] = None) -> ModelResponse:
+        """Send one completion to the LLM, bypassing the cache lookup but caching the response under the model that answered"""
+        metrics.increment("llm.calls")
+        model, response = self.hedged_completion(messages, response_format, admit_hedge, on_settled)
+        if self.cache is not None:
+            self.cache.put(self.cache.make_key(model, messages, response_format), response)
+        return response
+
+    def histogram(self, model: str, kind: str) -> LatencyHistogram:
+        with self._lock:
+            if (model, kind) not in self.latency:
+                self.latency[model, kind] = LatencyHistogram()
+            return self.latency[model, kind]
+
+    def latency_summary(self) -> Dict[str, Dict[str, float]]:
+        """Latency percentiles of each model and kind of request, in seconds"""
+        with self._lock:
+            keys = list(self.latency)
+        return {f"{model} {kind}": self.histogram(model, kind).summary() for model, kind in keys}
+
+    def hedge_delay(self, response_format: Any) -> Optional[float]:
+        """Seconds after which a request is sent again, None while the histogram is too small or the hedge budget is spent"""
+        histogram = self.histogram(self.model_name, call_kind(response_format))
+        with self._lock:
+            self._requests += 1
+            if histogram.count < AppConfig.LLM_HEDGE_MIN_SAMPLES or self._hedges >= self._requests * AppConfig.LLM_HEDGE_MAX_RATE:
+                return None
+        return max(histogram.percentile(AppConfig.LLM_HEDGE_PERCENTILE), AppConfig.LLM_HEDGE_MIN_DELAY)
+
+    def start_hedge(self, messages: List[Dict[str, str]], admit_hedge: Optional[HedgeAdmission]) -> Optional[Tuple[str, Callable[[Any], None]]]:
+        """Model of the hedged duplicate and the callback to run when it is done, None when the caller's limits have no room for it"""
+        release = None
+        if admit_hedge is not None:
+            release = admit_hedge(messages)
+            if release is None:
+                metrics.increment("llm.hedges_refused")
+                return None
+        with self._lock:
+            self._hedges += 1
+        metrics.increment("llm.hedged")
+
+        def finish(future: Any) -> None:
+            if release is None:
+                return
+            error = None if future.cancelled() else future.exception()
+            release(None if future.cancelled() or error is not None else future.result(), isinstance(error, RateLimitError))
+
+        return self.fallback_model or self.model_name, finish
+
+    def send(self, model: str, messages: List[Dict[str, str]], response_format: Any) -> ModelResponse:
+        start_time = time.monotonic()
+        response = completion(model=model, messages=messages, response_format=response_format)
+        self.histogram(model, call_kind(response_format)).record(time.monotonic() - start_time)
+        record_usage(response)
+        return response
+
+    def hedged_completion(self, messages: List[Dict[str, str]], response_format: Any = None, admit_hedge: Optional[HedgeAdmission] = None,
+                          on_settled: Optional[SettleCallback] = None) -> Tuple[str, ModelResponse]:
+        """Send a request, sending it again (to the fallback model if there is one) when it is slower than the usual tail
+        latency of its kind, and returning the model that answered first with its response. admit_hedge counts the duplicate
+        against the caller's limits. A request failing for another reason than a 429 is sent to the fallback model.
+        The slower request can't be cancelled, so on_settled is run only once the primary request is done too, which can be
+        after this returns: a caller limiting its parallel requests keeps the slot of the call until then"""
+        primary, answer, error = None, None, None
+
+        def settle(_: Any = None) -> None:
+            on_settled(None if answer is None else answer[1], isinstance(error, RateLimitError))
+
+        try:
+            primary = self.pool.submit(self.send, self.model_name, messages, response_format)
+            answer = self.race(primary, messages, response_format, admit_hedge)
+            return answer
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            if on_settled is not None:
+                if primary is None:
+                    settle()
+                else:
+                    primary.add_done_callback(settle)
+
+    def race(self, primary: Any, messages: List[Dict[str, str]], response_format: Any, admit_hedge: Optional[HedgeAdmission]) -> Tuple[str, ModelResponse]:
+        """Wait for the primary request of hedged_completion, hedging it when it is slow"""
+        delay = self.hedge_delay(response_format)
+        futures, models = [primary], {primary: self.model_name}
+        if not wait(futures, timeout=delay).done:
+            hedge = self.start_hedge(messages, admit_hedge)
+            if hedge is not None:
+                model, finish = hedge
+                futures.append(self.pool.submit(self.send, model, messages, response_format))
+                futures[-1].add_done_callback(finish)
+                models[futures[-1]] = model
+        # The slower request still runs to completion and its latency is recorded
+        pending, error = set(futures), None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is not primary:
+                        metrics.increment("llm.hedge_wins")
+                    return models[future], future.result()
+                error = future.exception()
+        if self.fallback_model and len(futures) == 1 and not isinstance(error, RateLimitError):
+            logger.warning("Request to %s failed (%s), sending it to %s", self.model_name, str(error), self.fallback_model)
+            metrics.increment("llm.fallbacks")
+            return self.fallback_model, self.send(self.fallback_model, messages, response_format)
+        raise error
+
+    async def asend(self, model: str, messages: List[Dict[str, str]], response_format: Any) -> ModelResponse:
+        start_time = time.monotonic()
+        response = await acompletion(model=model, messages=messages, response_format=response_format)
+        self.histogram(model, call_kind(response_format)).record(time.monotonic() - start_time)
+        record_usage(response)
+        return response
+
+    async def ahedged_completion(self, messages: List[Dict[str, str]], response_format: Any = None,
+                                 admit_hedge: Optional[HedgeAdmission] = None) -> Tuple[str, ModelResponse]:
+        """Async version of hedged_completion, the slower request is cancelled so it needs no on_settled"""
+        delay = self.hedge_delay(response_format)
+        primary = asyncio.ensure_future(self.asend(self.model_name, messages, response_format))
+        tasks, models = [primary], {primary: self.model_name}
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        hedge = None if done else self.start_hedge(messages, admit_hedge)
+        if hedge is not None:
+            model, finish = hedge
+            tasks.append(asyncio.ensure_future(self.asend(model, messages, response_format)))
+            tasks[-1].add_done_callback(finish)
+            models[tasks[-1]] = model
+        pending, error = set(tasks), None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            metrics.increment("llm.hedge_wins")
+                        return models[task], task.result()
+                    error = task.exception()
+        finally:
+            for task in pending:
+                task.cancel()
+        if self.fallback_model and len(tasks) == 1 and not isinstance(error, RateLimitError):
+            logger.warning("Request to %s failed (%s), sending it to %s", self.model_name, str(error), self.fallback_model)
+            metrics.increment("llm.fallbacks")
+            return self.fallback_model, await self.asend(self.fallback_model, messages, response_format)
+        raise error
+
+    def stream_completion(self, messages: List[Dict[str, str]]) -> Iterator[str]:
+        """Yield the text of a completion as it is generated, a cached completion is yielded at once"""
+        key = None
+        if self.cache is not None:
+            key = self.cache.make_key(self.model_name, messages, None)
+            cached = self.cache.get(key)
+            if cached is not None:
+                yield cached.choices[0].message.content
+                return
+        metrics.increment("llm.calls")
+        chunks = []
+        for chunk in completion(model=self.model_name, messages=messages, stream=True):
+            chunks.append(chunk)
+            delta = chunk.choices[0].delta.content
+            if delta:
+                yield delta
+        if key is not None:
+            self.cache.put(key, stream_chunk_builder(chunks, messages=messages))
+
+    async def astream_completion(self, messages: List[Dict[str, str]]) -> AsyncIterator[str]:
+        """Async version of stream_completion"""
+        key = None
+        if self.cache is not None:
+            key = self.cache.make_key(self.model_name, messages, None)
+            cached = self.cache.get(key)
+            if cached is not None:
+                yield cached.choices[0].message.content
+                return
+        metrics.increment("llm.calls")
+        chunks = []
+        async for chunk in await acompletion(model=self.model_name, messages=messages, stream=True):
+            chunks.append(chunk)
+            delta = chunk.choices[0].delta.content
+            if delta:
+                yield delta
+        if key is not None:
+            self.cache.put(key, stream_chunk_builder(chunks, messages=messages))
+
+    async def acompletion(self, messages: List[Dict[str, str]], response_format: Any = None) -> ModelResponse:
+        """Async version of completion"""
+        cached = self.cached(messages, response_format)
+        if cached is not None:
+            return cached
+        return await self.acall(messages, response_format)
+
+    async def acall(self, messages: List[Dict[str, str]], response_format: Any = None, admit_hedge: Optional[HedgeAdmission] = None) -> ModelResponse:
+        """Async version of call"""
+        metrics.increment("llm.calls")
+        model, response = await self.ahedged_completion(messages, response_format, admit_hedge)
+        if self.cache is not None:
+            self.cache.put(self.cache.make_key(model, messages, response_format), response)
+        return response
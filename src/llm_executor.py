@@ -0,0 +1,291 @@
+from litellm import RateLimitError, ModelResponse
+from concurrent.futures import ThreadPoolExecutor, wait
+from collections import deque
+from typing import List, Dict, Any, Union, Optional, Callable
+import threading
+import asyncio
+import logging
+import random
+import time
+import json
+
+from src.llm_client import LLMClient
+from src.settings import AppConfig
+from src.metrics import metrics
+
+
+logger = logging.getLogger(__name__)
+
+
+class SearchCancelled(Exception):
+    """The request was not sent, or its response not waited for, because the search was cancelled"""
+
+
+def wake(waiter: asyncio.Future) -> None:
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class RateBudget:
+    """Requests and tokens sent in the last minute, checked against the account's per-minute limits"""
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int) -> None:
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._lock = threading.Lock()
+        self._sent = deque()  # [sent_at, tokens] of the requests of the last minute
+        self._tokens = 0
+
+    def reserve(self, tokens: int) -> Union[List, float]:
+        """Reserve a request of the given tokens, returning its entry, or the seconds to wait when the budget is spent"""
+        with self._lock:
+            now = time.monotonic()
+            while self._sent and self._sent[0][0] <= now - 60:
+                self._tokens -= self._sent.popleft()[1]
+            tokens = min(tokens, self.tokens_per_minute)
+            if self._sent and (len(self._sent) >= self.requests_per_minute or self._tokens + tokens > self.tokens_per_minute):
+                return self._sent[0][0] + 60 - now
+            entry = [now, tokens]
+            self._sent.append(entry)
+            self._tokens += tokens
+            return entry
+
+    def cancel(self, entry: List) -> None:
+        """Give back a reserved request that was not sent"""
+        with self._lock:
+            if entry in self._sent:
+                self._sent.remove(entry)
+                self._tokens -= entry[1]
+
+    def correct(self, entry: List, tokens: int) -> None:
+        """Replace the estimated tokens of a reserved request with its real usage"""
+        with self._lock:
+            if entry in self._sent:
+                self._tokens += tokens - entry[1]
+            entry[1] = tokens
+
+
+class AdaptiveConcurrency:
+    """AIMD limit on the parallel requests: one more per round trip while they succeed, halved on a 429"""
+
+    def __init__(self, initial: int, maximum: int, decrease: float) -> None:
+        self.limit = float(initial)
+        self.maximum = maximum
+        self.decrease = decrease
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+        self._async_waiters = []  # (event loop, future) of the async callers waiting for a slot
+
+    def acquire(self, cancel_event: Optional[threading.Event] = None) -> float:
+        """Wait for a free slot, returning the start time of the request. Raises SearchCancelled once cancel_event is set"""
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                if cancel_event is not None and cancel_event.is_set():
+                    raise SearchCancelled()
+                self._condition.wait(AppConfig.SEARCH_CANCEL_POLL if cancel_event is not None else None)
+            self.in_flight += 1
+            return time.monotonic()
+
+    def try_acquire(self) -> Optional[float]:
+        """Take a free slot without waiting, returning the start time of the request or None when there is none"""
+        with self._condition:
+            if self.in_flight >= int(self.limit):
+                return None
+            self.in_flight += 1
+            return time.monotonic()
+
+    async def aacquire(self) -> float:
+        """Async version of acquire, the event loop is woken up by release instead of blocking a thread"""
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._condition:
+                if self.in_flight < int(self.limit):
+                    self.in_flight += 1
+                    return time.monotonic()
+                waiter = loop.create_future()
+                self._async_waiters.append((loop, waiter))
+            await waiter
+
+    def release(self, started_at: float, throttled: bool, completed: bool = True) -> None:
+        """Free the slot of a request. Only a completed request raises the limit, a cancelled or failed one just frees its slot"""
+        with self._condition:
+            self.in_flight -= 1
+            if not throttled:
+                if completed:
+                    self.limit = min(self.limit + 1 / self.limit, self.maximum)
+            elif started_at >= self._last_decrease:
+                # Requests sent before the last decrease were throttled at the old limit, they don't decrease it again
+                self.limit = max(self.limit * self.decrease, 1.0)
+                self._last_decrease = time.monotonic()
+                logger.info("Throttled, parallel LLM requests limited to %s", int(self.limit))
+            self._condition.notify_all()
+            waiters, self._async_waiters = self._async_waiters, []
+        for loop, waiter in waiters:
+            loop.call_soon_threadsafe(wake, waiter)
+
+
+class ScoringExecutor:
+    """Run many LLM requests within the account's rate limits, retrying only the throttled ones"""
+
+    def __init__(self, llm: LLMClient) -> None:
+        self.llm = llm
+        self.budget = RateBudget(AppConfig.LLM_REQUESTS_PER_MINUTE, AppConfig.LLM_TOKENS_PER_MINUTE)
+        self.concurrency = AdaptiveConcurrency(AppConfig.LLM_CONCURRENCY_INITIAL, AppConfig.LLM_CONCURRENCY_MAX, AppConfig.LLM_CONCURRENCY_DECREASE)
+        self.pool = ThreadPoolExecutor(max_workers=AppConfig.LLM_CONCURRENCY_MAX, thread_name_prefix="huntmate-llm")
+
+    def estimate_tokens(self, messages: List[Dict[str, str]]) -> int:
+        return len(json.dumps(messages)) // AppConfig.LLM_CHARS_PER_TOKEN + AppConfig.LLM_EXPECTED_OUTPUT_TOKENS
+
+    def reserve(self, tokens: int, cancel_event: Optional[threading.Event] = None) -> List:
+        while True:
+            reserved = self.budget.reserve(tokens)
+            if isinstance(reserved, list):
+                return reserved
+            metrics.increment("llm.budget_waits")
+            self.sleep(reserved, cancel_event)
+
+    @staticmethod
+    def sleep(seconds: float, cancel_event: Optional[threading.Event]) -> None:
+        """Sleep, raising SearchCancelled as soon as cancel_event is set"""
+        if cancel_event is None:
+            time.sleep(seconds)
+        elif cancel_event.wait(seconds):
+            raise SearchCancelled()
+
+    async def areserve(self, tokens: int) -> List:
+        while True:
+            reserved = self.budget.reserve(tokens)
+            if isinstance(reserved, list):
+                return reserved
+            metrics.increment("llm.budget_waits")
+            await asyncio.sleep(reserved)
+
+    def correct(self, entry: List, response: ModelResponse) -> None:
+        usage = getattr(response, "usage", None)
+        if usage is not None and usage.total_tokens:
+            self.budget.correct(entry, usage.total_tokens)
+
+    def admit_hedge(self, messages: List[Dict[str, str]]) -> Optional[Callable[[Optional[ModelResponse], bool], None]]:
+        """Reserve the rate budget and a slot for a hedged duplicate without waiting, None when there is no room for it.
+        A hedge is only worth it when it doesn't delay other requests"""
+        entry = self.budget.reserve(self.estimate_tokens(messages))
+        if not isinstance(entry, list):
+            return None
+        started_at = self.concurrency.try_acquire()
+        if started_at is None:
+            self.budget.cancel(entry)
+            return None
+
+        def release(response: Optional[ModelResponse], throttled: bool) -> None:
+            self.concurrency.release(started_at, throttled, completed=response is not None)
+            if response is not None:
+                self.correct(entry, response)
+
+        return release
+
+    def run(self, messages: List[Dict[str, str]], response_format: Any = None, cancel_event: Optional[threading.Event] = None) -> ModelResponse:
+        """Send one request, waiting for the rate budget and a free slot, and retrying it with jitter when throttled.
+        Once cancel_event is set, the request is not sent or retried anymore and SearchCancelled is raised.
+        The slot is freed once the primary request is done, a hedge answering first doesn't free it while the primary still runs"""
+        tokens = self.estimate_tokens(messages)
+        for attempt in range(AppConfig.LLM_THROTTLE_MAX_RETRIES + 1):
+            if cancel_event is not None and cancel_event.is_set():
+                raise SearchCancelled()
+            entry = self.reserve(tokens, cancel_event)
+            try:
+                started_at = self.concurrency.acquire(cancel_event)
+            except SearchCancelled:
+                self.budget.cancel(entry)
+                raise
+            throttled = False
+
+            def release(response: Optional[ModelResponse], throttled: bool, started_at: float = started_at) -> None:
+                self.concurrency.release(started_at, throttled, completed=response is not None)
+
+            try:
+                response = self.llm.call(messages, response_format, self.admit_hedge, on_settled=release)
+            except RateLimitError:
+                throttled = True
+                if attempt == AppConfig.LLM_THROTTLE_MAX_RETRIES:
+                    raise
+            if not throttled:
+                self.correct(entry, response)
+                return response
+            metrics.increment("llm.throttled")
+            self.sleep(self.backoff(attempt), cancel_event)
+
+    async def arun(self, messages: List[Dict[str, str]], response_format: Any = None) -> ModelResponse:
+        """Async version of run, sharing the rate budget and the parallel request limit with the sync callers"""
+        tokens = self.estimate_tokens(messages)
+        for attempt in range(AppConfig.LLM_THROTTLE_MAX_RETRIES + 1):
+            entry = await self.areserve(tokens)
+            started_at = await self.concurrency.aacquire()
+            throttled, response = False, None
+            try:
+                response = await self.llm.acall(messages, response_format, self.admit_hedge)
+            except RateLimitError:
+                throttled = True
+                if attempt == AppConfig.LLM_THROTTLE_MAX_RETRIES:
+                    raise
+            finally:
+                # A request cancelled by amap frees its slot without raising the limit
+                self.concurrency.release(started_at, throttled, completed=response is not None)
+            if not throttled:
+                self.correct(entry, response)
+                return response
+            metrics.increment("llm.throttled")
+            await asyncio.sleep(self.backoff(attempt))
+
+    @staticmethod
+    def backoff(attempt: int) -> float:
+        # Full jitter, so the throttled requests of a batch don't come back all at once
+        return random.uniform(0, min(AppConfig.LLM_THROTTLE_BACKOFF * 2 ** attempt, AppConfig.LLM_THROTTLE_BACKOFF_MAX))
+
+    def map(self, messages: List[List[Dict[str, str]]], response_format: Any = None, use_cache: bool = True,
+            cancel_event: Optional[threading.Event] = None) -> List[Union[ModelResponse, Exception]]:
+        """Run the requests in parallel, a request that fails is returned as its exception.
+        Retries of bad responses skip the cache, their new response replaces the cached one.
+        Once cancel_event is set, no more requests are sent and the requests still running are returned as SearchCancelled"""
+        responses = [self.llm.cached(message, response_format) if use_cache else None for message in messages]
+        missing = [i for i, response in enumerate(responses) if response is None]
+        futures = [self.pool.submit(self.run, messages[i], response_format, cancel_event) for i in missing]
+        pending = set(futures)
+        while pending and not (cancel_event is not None and cancel_event.is_set()):
+            _, pending = wait(pending, timeout=AppConfig.SEARCH_CANCEL_POLL if cancel_event is not None else None)
+        for i, future in zip(missing, futures):
+            if future in pending:
+                # The requests already sent finish in the background, their slots are released when they do
+                future.cancel()
+                responses[i] = SearchCancelled()
+                continue
+            try:
+                responses[i] = future.result()
+            except Exception as e:
+                responses[i] = e
+        logger.info("Batch of %s completions, %s sent to the LLM, %s parallel requests allowed",
+                    len(messages), len(missing), int(self.concurrency.limit))
+        return responses
+
+    async def amap(self, messages: List[List[Dict[str, str]]], response_format: Any = None, use_cache: bool = True,
+                   cancel_event: Optional[threading.Event] = None) -> List[Union[ModelResponse, Exception]]:
+        """Async version of map, the requests run on the event loop and share the same limits as the sync callers.
+        Once cancel_event is set, the requests still waiting or running are cancelled"""
+        responses = [self.llm.cached(message, response_format) if use_cache else None for message in messages]
+        missing = [i for i, response in enumerate(responses) if response is None]
+        tasks = [asyncio.ensure_future(self.arun(messages[i], response_format)) for i in missing]
+        pending = set(tasks)
+        while pending and not (cancel_event is not None and cancel_event.is_set()):
+            _, pending = await asyncio.wait(pending, timeout=AppConfig.SEARCH_CANCEL_POLL if cancel_event is not None else None)
+        for task in pending:
+            task.cancel()
+        # Cancelling also stops the requests in flight, waiting for them only lets them release their slots
+        await asyncio.gather(*pending, return_exceptions=True)
+        for i, task in zip(missing, tasks):
+            if task in pending:
+                responses[i] = SearchCancelled()
+            else:
+                responses[i] = task.exception() or task.result()
+        logger.info("Batch of %s completions, %s sent to the LLM, %s parallel requests allowed",
+                    len(messages), len(missing), int(self.concurrency.limit))
+        return responses
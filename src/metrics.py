@@ -0,0 +1,28 @@
+from collections import Counter
+from typing import Dict
+import threading
+
+
+class Metrics:
+    """Thread-safe counters used to track cache hits, LLM calls and other performance numbers"""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counters = Counter()
+
+    def increment(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self._counters[name] += value
+
+    def get(self, name: str) -> int:
+        with self._lock:
+            return self._counters[name]
+
+    def snapshot(self) -> Dict[str, int]:
+        """Return a copy of all counters"""
+        with self._lock:
+            return dict(self._counters)
+
+
+# Process-wide metrics shared by all HuntMate components
+metrics = Metrics()
@@ -1,6 +1,7 @@
 from typing_extensions import TypedDict
 from pydantic import BaseModel, Field
-from typing import List, Literal
+from typing import List, Literal, Optional, Any
+import threading
 from enum import Enum
 
 from src.settings import AppConfig
@@ -55,12 +56,15 @@ class Route(BaseModel):
 class State(TypedDict):
     user_input: str
     route_decision: str
+    route_tier: str
     job_search_params: JobSearchParams
     final_response: str
     skip_router: bool
     filled_job_form: bool 
     selected_websites: List[str]
     information_to_memorize: List[str]
+    cancel_event: Optional[threading.Event]
+    chat: Any  # The ChatSession of the user, not imported here as it would import the storage into the models
 
 
 # State schema for the LLM Agent
@@ -70,6 +74,14 @@ class JobMatch(BaseModel):
     job_summary: str = Field(description="Summary of the job in 50 words.")
 
 
+class IndexedJobMatch(JobMatch):
+    job_index: int = Field(description="The number of the job this result is about.")
+
+
+class JobMatchList(BaseModel):
+    matches: List[IndexedJobMatch] = Field(description="One result for each job.")
+
+
 class JobUserMention(BaseModel): 
     steps: list[Step]
     description: str = Field(description="Description of the job.")
@@ -1,4 +1,4 @@
-from typing import List
+from typing import List, Dict
 
 from src.models import JobSearchParams
 
@@ -63,20 +63,7 @@ def fill_job_preferences(user_input) -> List[dict]:
     return messages
 
 
-def check_job_match(user_input: JobSearchParams, title:str, company:str, job_description:str, memory_info: List[str]) -> List[dict]:
-    if user_input.experience == []:
-        experience = "all experience levels are acceptable."
-    else:
-        experience = "Only the following experience levels are acceptable: "
-        for i in user_input.experience:
-            experience += i.name + " "
-    
-    recent_memory = ", ".join(memory_info[-10:]) if memory_info else "None"
-
-    messages = [
-        {"role": "system",  "content": """  
-                Fill the provided Pydantic schema with the user's input and the job description.
-                For the `match_score`, give a score based on the following ruberic: 
+JOB_MATCH_RUBRIC = """                For the `match_score`, give a score based on the following ruberic: 
                 - 5 (Perfect Match): The job aligns with all essential preferences: at least one keyword, one of the experience level. Extra preferences (if provided) are also met.
                 - 4 (Strong Match): The job matches most preferences including at least one keyword (at least 4/5 categories). Extra preferences are partially met or moderately aligned.
                 - 3 (Moderate Match): The job meets at least 3/5 essential categories. It may have minor misalignment (e.g. experience level mismatch). Extra preferences are partially considered.
@@ -90,15 +77,31 @@ def check_job_match(user_input: JobSearchParams, title:str, company:str, job_des
                 For example: if the keyword is "machine learning" but the job title is "Data Scientist" and the description includes machine learning tasks, that's still a valid match.
 
                 Provide a brief justification for the score under `reasoning`.
-                """},
+                """
 
-        {"role": "user", "content": f"""
+
+def job_match_context(user_input: JobSearchParams, memory_info: List[str]) -> dict:
+    """System message of the scoring requests: everything fixed for a search, so it is a byte-identical prefix of all of them.
+    Only the jobs go in the user message. It is about 450-550 tokens (with the response schema a little more), below the
+    1024 tokens from which OpenAI caches a prefix, so gpt-4o-mini reports no cached tokens for it. Padding it up to the
+    minimum would cost more than the cache discount saves; the layout only pays off with a longer rubric or memory, or a
+    provider with a lower minimum"""
+    recent_memory = ", ".join(memory_info[-10:]) if memory_info else "None"
+    return {"role": "system",  "content": """  
+                Fill the provided Pydantic schema from the user's preferences below and the job description given in the user message.
+""" + JOB_MATCH_RUBRIC + f"""
                 # User Preference: 
                 - Keywords: {str(user_input.job_keywords)}
                 - Experience: {str(user_input.experience)}
                 - Extra Preferences: {str(user_input.extra_preferences)} 
                 - General Information About the User in Memory: {str(recent_memory)}
-                ----------------------------------------------
+                """}
+
+
+def check_job_match(user_input: JobSearchParams, title:str, company:str, job_description:str, memory_info: List[str]) -> List[dict]:
+    messages = [
+        job_match_context(user_input, memory_info),
+        {"role": "user", "content": f"""
                 # About the job:
                 - Job Title: {title}
                 - Company: {company}
@@ -107,6 +110,24 @@ def check_job_match(user_input: JobSearchParams, title:str, company:str, job_des
     return messages
 
 
+def check_job_matches(user_input: JobSearchParams, jobs: List[Dict[str, str]], memory_info: List[str]) -> List[dict]:
+    """Prompt scoring several jobs in one request, it shares the system message of the single job prompt"""
+    job_sections = "".join(f"""
+                ----------------------------------------------
+                # Job {index}:
+                - Job Title: {job['title']}
+                - Company: {job['company']}
+                - Job Description: {job['job_description']}""" for index, job in enumerate(jobs, start=1))
+
+    messages = [
+        job_match_context(user_input, memory_info),
+        {"role": "user", "content": f"""
+                Give one result for each of the {len(jobs)} jobs below, scoring each job on its own against the user's preferences.
+                Set `job_index` to the number of the job the result is about.""" + job_sections}
+    ]
+    return messages
+
+
 def router_prompt(user_input:str) -> List[dict]:
     messages = [
         {"role": "system", "content": """
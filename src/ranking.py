@@ -0,0 +1,104 @@
+from typing import List, Dict, Tuple
+import pandas as pd
+import numpy as np
+import logging
+import re
+
+from src.settings import AppConfig
+
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9][a-z0-9+#.]*[a-z0-9+#]|[a-z0-9]")
+STOP_WORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "i", "in", "is", "it", "job", "jobs",
+    "like", "looking", "me", "my", "of", "on", "or", "prefer", "related", "that", "the", "to", "want", "with",
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """Split a text into lowercase word tokens"""
+    return TOKEN_PATTERN.findall(str(text).lower())
+
+
+# Word-boundary keyword matcher allowing common suffixes, compiled once per search
+class KeywordMatcher:
+    def __init__(self, keywords: List[str]) -> None:
+        words = {word.lower() for keyword in keywords for word in keyword.split()}
+        alternatives = "|".join(re.escape(word) for word in sorted(words, key=len, reverse=True))
+        # Common inflections count as hits ("engineers", "engineering"), but a keyword inside another word doesn't ("ai" in "maintain")
+        self.pattern = re.compile(rf"(?<![a-z0-9])(?:{alternatives})(?:s|es|ing|ed)?(?![a-z0-9])", re.IGNORECASE) if words else None
+
+    def count(self, jobs: List[Dict[str, str]]) -> List[int]:
+        """Number of keyword hits in the title and description of every job"""
+        if self.pattern is None or not jobs:
+            return [0] * len(jobs)
+        texts = pd.Series([f"{job['title']}\n{job['job_description']}" for job in jobs], dtype="string")
+        return texts.str.count(self.pattern).fillna(0).astype(int).tolist()
+
+
+# BM25 ranking of the found jobs against the user's keywords and extra preferences
+class BM25Ranker:
+    def __init__(self, keywords: List[str], extra_preferences: str = "", k1: float = 1.5, b: float = 0.75) -> None:
+        self.k1 = k1
+        self.b = b
+        weights = {}
+        for term in tokenize(extra_preferences):
+            if term not in STOP_WORDS:
+                weights[term] = AppConfig.RANKER_EXTRA_PREFERENCES_WEIGHT
+        for keyword in keywords:
+            for term in tokenize(keyword):
+                weights[term] = 1.0
+        self.terms = {term: i for i, term in enumerate(weights)}
+        self.term_weights = np.array(list(weights.values()), dtype=np.float64)
+        # Corpus statistics of all the jobs seen in this search, per field (title, description)
+        self.num_docs = 0
+        self.doc_freq = np.zeros((2, len(self.terms)), dtype=np.float64)
+        self.total_length = np.zeros(2, dtype=np.float64)
+        self._counts: Dict[int, Tuple[np.ndarray, np.ndarray]] = {}
+
+    def _field_counts(self, text: str) -> Tuple[np.ndarray, int]:
+        """Count the query terms in a text, also returning the text length in tokens"""
+        tokens = tokenize(text)
+        ids = np.fromiter((self.terms.get(token, -1) for token in tokens), dtype=np.int64, count=len(tokens))
+        ids = ids[ids >= 0]
+        return np.bincount(ids, minlength=len(self.terms)).astype(np.float64), len(tokens)
+
+    def add(self, jobs: List[Dict[str, str]]) -> None:
+        """Add newly found jobs to the corpus statistics"""
+        for job in jobs:
+            title_counts, title_length = self._field_counts(job["title"])
+            description_counts, description_length = self._field_counts(job["job_description"])
+            counts = np.vstack([title_counts, description_counts])
+            lengths = np.array([title_length, description_length], dtype=np.float64)
+            self._counts[id(job)] = (counts, lengths)
+            self.num_docs += 1
+            self.doc_freq += counts > 0
+            self.total_length += lengths
+
+    def scores(self, jobs: List[Dict[str, str]]) -> np.ndarray:
+        """BM25 score of every job, with title matches weighted above description matches"""
+        if not jobs or not self.terms:
+            return np.zeros(len(jobs))
+        counts = np.stack([self._counts[id(job)][0] for job in jobs])    # jobs x fields x terms
+        lengths = np.stack([self._counts[id(job)][1] for job in jobs])   # jobs x fields
+        avg_length = np.maximum(self.total_length / max(self.num_docs, 1), 1.0)
+        idf = np.log(1 + (self.num_docs - self.doc_freq + 0.5) / (self.doc_freq + 0.5))
+        norm = self.k1 * (1 - self.b + self.b * lengths / avg_length)
+        field_scores = (idf * counts * (self.k1 + 1) / (counts + norm[:, :, None])) @ self.term_weights
+        return field_scores @ np.array([AppConfig.RANKER_TITLE_WEIGHT, 1.0])
+
+    def rank(self, jobs: List[Dict[str, str]]) -> Tuple[List[Dict[str, str]], List[Dict[str, str]]]:
+        """Order jobs best-first, splitting off the tail scoring below RANKER_MIN_RELATIVE_SCORE of the best job"""
+        if not jobs:
+            return jobs, []
+        scores = self.scores(jobs)
+        # Ties (e.g. no BM25 signal at all) are broken by the keyword hit counts of the KeywordMatcher
+        hits = np.array([job.get("keyword_hits", 0) for job in jobs])
+        order = np.lexsort((-hits, -scores))
+        cutoff = scores[order[0]] * AppConfig.RANKER_MIN_RELATIVE_SCORE
+        ranked = [jobs[i] for i in order if scores[i] >= cutoff]
+        tail = [jobs[i] for i in order if scores[i] < cutoff]
+        if tail:
+            logger.info("Ranker deferred %s of %s jobs below score %.2f", len(tail), len(jobs), cutoff)
+        return ranked, tail
@@ -0,0 +1,79 @@
+from urllib.parse import urlsplit, urlunsplit
+from typing import List, Dict, Optional
+import threading
+import hashlib
+import logging
+import sqlite3
+import json
+import time
+import os
+
+from src.models import JobMatch, JobSearchParams
+from src.settings import AppConfig
+from src.metrics import metrics
+
+
+logger = logging.getLogger(__name__)
+
+# Persistent store of JobMatch results, so a posting is only scored once per set of preferences
+class JobScoreStore:
+    def __init__(self, path: str = AppConfig.JOB_SCORE_STORE_PATH, ttl: float = AppConfig.JOB_SCORE_TTL) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS job_scores (
+                job_key TEXT NOT NULL,
+                preferences_hash TEXT NOT NULL,
+                memory_hash TEXT NOT NULL,
+                job_match TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (job_key, preferences_hash, memory_hash)
+            )""")
+        self._conn.commit()
+
+    @staticmethod
+    def job_key(job: Dict[str, str]) -> str:
+        """Identify a posting by its job id, or by its canonical URL when the id is missing"""
+        if isinstance(job.get("job_id"), str) and job["job_id"]:
+            return job["job_id"]
+        parts = urlsplit(str(job.get("job_posting_link", "")))
+        return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path.rstrip("/"), "", ""))
+
+    @staticmethod
+    def preferences_hash(search_params: JobSearchParams) -> str:
+        """Hash the search parameters that are part of the scoring prompt"""
+        relevant = {
+            "job_keywords": search_params.job_keywords,
+            "experience": [level.name for level in search_params.experience],
+            "extra_preferences": search_params.extra_preferences,
+        }
+        return hashlib.sha256(json.dumps(relevant, sort_keys=True).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def memory_hash(memory_info: List[str]) -> str:
+        """Hash the memory snippet that is part of the scoring prompt (the prompt only uses the last 10 items)"""
+        return hashlib.sha256(json.dumps(memory_info[-10:]).encode("utf-8")).hexdigest()
+
+    def get(self, job: Dict[str, str], preferences_hash: str, memory_hash: str) -> Optional[JobMatch]:
+        """Return the stored JobMatch of a job, or None if it was never scored with these preferences"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT job_match FROM job_scores WHERE job_key = ? AND preferences_hash = ? AND memory_hash = ? AND created_at >= ?",
+                (self.job_key(job), preferences_hash, memory_hash, time.time() - self.ttl),
+            ).fetchone()
+        if row is None:
+            metrics.increment("score_store.miss")
+            return None
+        metrics.increment("score_store.hit")
+        return JobMatch.parse_raw(row[0])
+
+    def put(self, job: Dict[str, str], preferences_hash: str, memory_hash: str, job_match: JobMatch) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO job_scores (job_key, preferences_hash, memory_hash, job_match, created_at) VALUES (?, ?, ?, ?, ?)",
+                (self.job_key(job), preferences_hash, memory_hash, job_match.json(), time.time()),
+            )
+            self._conn.commit()
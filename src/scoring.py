@@ -0,0 +1,159 @@
+from typing import List, Dict, Tuple, Optional
+import logging
+import math
+import json
+import re
+
+from src.ranking import BM25Ranker, KeywordMatcher
+from src.models import JobMatch, JobMatchList, JobSearchParams
+from src.settings import AppConfig
+from src.metrics import metrics
+
+
+logger = logging.getLogger(__name__)
+
+STRONG_MATCH_SCORE = 4  # Scores at or above this value count towards the user's limit
+
+SCORE_PATTERN = re.compile(r'"match_score"\s*:\s*"?([1-5])\b')
+
+
+def salvage_string(content: str, name: str) -> str:
+    """Value of a string field of truncated JSON, up to where it was cut"""
+    match = re.search(rf'"{name}"\s*:\s*"((?:[^"\\]|\\.)*)', content)
+    if match is None:
+        return ""
+    try:
+        return json.loads('"' + match.group(1) + '"')
+    except ValueError:
+        return match.group(1)
+
+
+def parse_job_match(content: Optional[str]) -> Optional[JobMatch]:
+    """Parse the JobMatch answer of the LLM, salvaging the score of truncated or malformed JSON.
+    Returns None when there is no valid score to salvage"""
+    if not content:
+        return None
+    try:
+        result = JobMatch.parse_raw(content)
+    except ValueError:
+        score = SCORE_PATTERN.search(content)
+        if score is None:
+            return None
+        metrics.increment("scoring.salvaged")
+        return JobMatch(match_score=int(score.group(1)), reasonning=salvage_string(content, "reasonning"), job_summary=salvage_string(content, "job_summary"))
+    if not 1 <= result.match_score <= 5:
+        return None
+    return result
+
+
+def parse_job_matches(content: Optional[str], count: int) -> Dict[int, JobMatch]:
+    """Parse the answer of a packed scoring request into the results of its jobs, by position in the pack.
+    Results with an unknown job number or an invalid score are dropped, the first result of a job wins"""
+    if not content:
+        return {}
+    try:
+        answer = JobMatchList.parse_raw(content)
+    except ValueError:
+        return {}
+    matches = {}
+    for match in answer.matches:
+        position = match.job_index - 1
+        if 0 <= position < count and 1 <= match.match_score <= 5 and position not in matches:
+            matches[position] = JobMatch(match_score=match.match_score, reasonning=match.reasonning, job_summary=match.job_summary)
+    return matches
+
+
+def pack_jobs(jobs: List[Dict[str, str]]) -> List[List[int]]:
+    """Split the jobs into packs scored by one request each, packing fewer jobs together when their descriptions are long"""
+    packs, pack, size = [], [], 0
+    for i, job in enumerate(jobs):
+        length = len(str(job["title"])) + len(str(job["company"])) + len(str(job["job_description"]))
+        if pack and (len(pack) == AppConfig.JOB_MATCH_PACK_MAX_JOBS or size + length > AppConfig.JOB_MATCH_PACK_MAX_CHARS):
+            packs.append(pack)
+            pack, size = [], 0
+        pack.append(i)
+        size += length
+    if pack:
+        packs.append(pack)
+    return packs
+
+
+class ScoringScheduler:
+    """Decide how many jobs to score next from the observed rate of strong matches"""
+
+    def __init__(self, limit: int) -> None:
+        self.limit = limit
+        self.scored = 0
+        self.strong = 0
+
+    @property
+    def remaining(self) -> int:
+        """Number of strong matches still needed to satisfy the user's limit"""
+        return max(self.limit - self.strong, 0)
+
+    def is_satisfied(self) -> bool:
+        return self.remaining == 0
+
+    def record(self, match_scores: List[int]) -> None:
+        """Record the scores of a finished batch"""
+        self.scored += len(match_scores)
+        self.strong += sum(1 for score in match_scores if score >= STRONG_MATCH_SCORE)
+        logger.info("Scored %s jobs, %s strong matches, %s still needed", self.scored, self.strong, self.remaining)
+
+    def next_batch_size(self) -> int:
+        """Size of the next batch: just enough jobs to find the remaining strong matches at the observed rate"""
+        if self.scored == 0:
+            return min(AppConfig.JOB_MATCH_INITIAL_BATCH_SIZE, AppConfig.JOB_MATCH_BATCH_SIZE)
+        rate = max(self.strong / self.scored, AppConfig.JOB_MATCH_MIN_STRONG_RATE)
+        size = math.ceil(self.remaining / rate * AppConfig.JOB_MATCH_OVERSAMPLING)
+        return max(AppConfig.JOB_MATCH_MIN_BATCH_SIZE, min(size, AppConfig.JOB_MATCH_BATCH_SIZE))
+
+
+class ScoringQueue:
+    """Jobs found during a search, waiting to be scored best-first in batches sized by the ScoringScheduler"""
+
+    def __init__(self, search_params: JobSearchParams) -> None:
+        self.scheduler = ScoringScheduler(search_params.limit)
+        self.matcher = KeywordMatcher(search_params.job_keywords)
+        self.ranker = BM25Ranker(search_params.job_keywords, search_params.extra_preferences)
+        self.pending: List[Dict[str, str]] = []
+        self.deferred: List[Dict[str, str]] = []  # Ranked tail, only scored when nothing better is left and the limit isn't met
+        self.combinations = min(len(search_params.job_keywords), AppConfig.MAX_SEARCH_ITEMS) * min(len(search_params.locations), AppConfig.MAX_SEARCH_ITEMS)
+        self.scraped = 0
+        self.found = 0
+        self.score_answer: Dict[str, List[Tuple[Dict[str, str], JobMatch]]] = {str(score): [] for score in range(1, 6)}
+
+    def is_done(self, scraping: bool) -> bool:
+        """Stop once enough strong matches are found, or when every found job is scored and the scrapers are done"""
+        return self.scheduler.is_satisfied() or (not scraping and not self.pending and not self.deferred)
+
+    def add(self, jobs: List[Dict[str, str]]) -> None:
+        """Queue the jobs found for a scraped keyword and location pair, re-ranking everything that is still waiting.
+        A deferred job goes back to the head if the new jobs lower the cutoff"""
+        self.scraped += 1
+        self.found += len(jobs)
+        self.ranker.add(jobs)
+        self.pending, self.deferred = self.ranker.rank(self.pending + self.deferred + jobs)
+
+    def next_batch(self) -> List[Dict[str, str]]:
+        if not self.pending:
+            # The scrapers are done and the head is scored without meeting the limit, score the tail best-first
+            self.pending, self.deferred = self.deferred, []
+        batch_size = self.scheduler.next_batch_size()
+        batch, self.pending = self.pending[:batch_size], self.pending[batch_size:]
+        logger.info("Scoring %s jobs, %s waiting", len(batch), len(self.pending))
+        return batch
+
+    def record(self, scored_jobs: List[Tuple[Dict[str, str], JobMatch]]) -> None:
+        for job, result in scored_jobs:
+            self.score_answer[str(result.match_score)].append((job, result))
+        self.scheduler.record([result.match_score for _, result in scored_jobs])
+
+    def progress(self) -> Dict[str, int]:
+        return {
+            "combinations_scraped": self.scraped,
+            "combinations": self.combinations,
+            "jobs_found": self.found,
+            "jobs_scored": self.scheduler.scored,
+            "strong_matches": self.scheduler.strong,
+        }
@@ -0,0 +1,49 @@
+from typing import List, Dict, Any, Tuple, Optional
+import threading
+import logging
+
+from src.models import JobMatch
+
+
+logger = logging.getLogger(__name__)
+
+# Job search running outside of the Streamlit script thread
+class BackgroundSearch:
+    """Run a job search in a background thread, keeping its progress and partial results for the UI to poll"""
+
+    def __init__(self, chatbot: Any, **run_kwargs: Any) -> None:
+        self.chatbot = chatbot
+        self.run_kwargs = run_kwargs
+        self.cancel_event = threading.Event()
+        self.progress: Dict[str, int] = {}
+        self.matches: List[Tuple[Dict[str, str], JobMatch]] = []
+        self.response: Optional[str] = None
+        self.thread = threading.Thread(target=self.run, name="huntmate-search", daemon=True)
+
+    def start(self) -> "BackgroundSearch":
+        self.thread.start()
+        return self
+
+    def run(self) -> None:
+        try:
+            for event in self.chatbot.run_stream(cancel_event=self.cancel_event, **self.run_kwargs):
+                if "progress" in event:
+                    self.progress = event["progress"]
+                elif "job" in event:
+                    self.matches.append((event["job"], event["job_match"]))
+                elif "final_response" in event:
+                    self.response = event["final_response"]
+        except Exception as e:
+            logger.error("Error in the background job search: %s", str(e))
+            self.response = "Something went wrong while searching for jobs. Please try again."
+
+    def cancel(self) -> None:
+        """Stop scraping and scoring, the response keeps the jobs scored so far"""
+        self.cancel_event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_event.is_set()
+
+    def is_done(self) -> bool:
+        return not self.thread.is_alive()
@@ -0,0 +1,146 @@
+from typing import Dict, Iterable, Optional
+import threading
+import hashlib
+import logging
+import math
+import time
+import os
+
+from src.storage import HuntMateStore
+from src.settings import AppConfig
+
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over string keys"""
+
+    def __init__(self, capacity: int, error_rate: float, bits: Optional[bytearray] = None) -> None:
+        self.num_bits = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bits if bits is not None else bytearray((self.num_bits + 7) // 8)
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.num_bits for i in range(self.num_hashes))
+
+    def add(self, key: str) -> None:
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+# Index of the jobs already shown to the user, forgetting them after SEEN_JOBS_TTL
+class SeenJobsIndex:
+    """Job ids are grouped in time buckets. Each bucket has a Bloom filter, kept in memory and saved under
+    db/seen_jobs/, which answers most lookups; a positive answer is confirmed in the exact SQLite table.
+    Expiring a bucket only means dropping its filter file and deleting its rows."""
+
+    def __init__(self, store: HuntMateStore, directory: str = AppConfig.SEEN_JOBS_DIR, ttl: float = AppConfig.SEEN_JOBS_TTL,
+                 bucket_seconds: float = AppConfig.SEEN_JOBS_BUCKET_SECONDS) -> None:
+        self.store = store
+        self.directory = directory
+        self.ttl = ttl
+        self.bucket_seconds = bucket_seconds
+        self._lock = threading.Lock()
+        self._filters: Dict[int, BloomFilter] = {}
+        self._dirty = set()
+        os.makedirs(directory, exist_ok=True)
+        self.expire()
+        self._load_filters()
+
+    def _bucket(self, timestamp: float) -> int:
+        return int(timestamp // self.bucket_seconds)
+
+    def _new_filter(self, bits: Optional[bytearray] = None) -> BloomFilter:
+        return BloomFilter(AppConfig.SEEN_JOBS_BLOOM_CAPACITY, AppConfig.SEEN_JOBS_BLOOM_ERROR_RATE, bits)
+
+    def _filter_path(self, bucket: int) -> str:
+        return os.path.join(self.directory, f"{bucket}.bloom")
+
+    def _load_filters(self) -> None:
+        """Load the saved filters, rebuilding them from the exact store when a file is missing or was saved with other settings"""
+        oldest = self._bucket(time.time() - self.ttl)
+        for file_name in os.listdir(self.directory):
+            bucket = int(file_name.split(".")[0]) if file_name.endswith(".bloom") else None
+            if bucket is None or bucket < oldest:
+                continue
+            with open(os.path.join(self.directory, file_name), "rb") as f:
+                bits = bytearray(f.read())
+            bloom = self._new_filter(bits)
+            if len(bits) == (bloom.num_bits + 7) // 8:
+                self._filters[bucket] = bloom
+        rebuilt = 0
+        for job_id, seen_at in self.store.seen_jobs_since(time.time() - self.ttl):
+            bucket = self._bucket(seen_at)
+            if bucket not in self._filters or bucket in self._dirty:
+                if bucket not in self._filters:
+                    self._filters[bucket] = self._new_filter()
+                self._filters[bucket].add(job_id)
+                self._dirty.add(bucket)
+                rebuilt += 1
+        if rebuilt:
+            logger.info("Rebuilt seen jobs filters from %s stored jobs", rebuilt)
+            self.flush()
+
+    def __contains__(self, job_id) -> bool:
+        job_id = str(job_id)
+        oldest = self._bucket(time.time() - self.ttl)
+        with self._lock:
+            maybe_seen = any(job_id in bloom for bucket, bloom in self._filters.items() if bucket >= oldest)
+        return maybe_seen and self.store.is_seen_job(job_id, time.time() - self.ttl)
+
+    def add(self, job_ids: Iterable) -> None:
+        """Record newly shown jobs"""
+        job_ids = [str(job_id) for job_id in job_ids]
+        if not job_ids:
+            return
+        now = time.time()
+        self.store.add_seen_jobs(job_ids, now)
+        bucket = self._bucket(now)
+        if bucket not in self._filters:
+            # A new bucket means a bucket may also have passed the TTL, a long-running process expires it here
+            self.expire()
+        with self._lock:
+            if bucket not in self._filters:
+                self._filters[bucket] = self._new_filter()
+            for job_id in job_ids:
+                self._filters[bucket].add(job_id)
+            self._dirty.add(bucket)
+        self.flush()
+
+    def flush(self) -> None:
+        """Save the filters that changed"""
+        with self._lock:
+            for bucket in self._dirty:
+                path = self._filter_path(bucket)
+                with open(path + ".tmp", "wb") as f:
+                    f.write(self._filters[bucket].bits)
+                os.replace(path + ".tmp", path)
+            self._dirty.clear()
+
+    def expire(self) -> None:
+        """Forget the jobs seen more than the TTL ago"""
+        cutoff = time.time() - self.ttl
+        oldest = self._bucket(cutoff)
+        self.store.delete_seen_jobs_before(cutoff)
+        with self._lock:
+            for bucket in [bucket for bucket in self._filters if bucket < oldest]:
+                del self._filters[bucket]
+                self._dirty.discard(bucket)
+            for file_name in os.listdir(self.directory):
+                if file_name.endswith(".bloom") and int(file_name.split(".")[0]) < oldest:
+                    os.remove(os.path.join(self.directory, file_name))
+
+    def clear(self) -> None:
+        """Forget all the seen jobs (the store's rows are cleared by the store itself)"""
+        with self._lock:
+            self._filters.clear()
+            self._dirty.clear()
+            for file_name in os.listdir(self.directory):
+                if file_name.endswith(".bloom"):
+                    os.remove(os.path.join(self.directory, file_name))
@@ -0,0 +1,83 @@
+from typing import List, Optional
+import threading
+import logging
+import atexit
+
+from src.storage import HuntMateStore
+from src.settings import AppConfig
+
+
+logger = logging.getLogger(__name__)
+
+# In-process cache of the user's memory and chat history, written to the store in the background
+class SessionMemory:
+    def __init__(self, store: HuntMateStore, flush_delay: float = AppConfig.SESSION_FLUSH_DELAY) -> None:
+        self.store = store
+        self.flush_delay = flush_delay
+        self._lock = threading.RLock()
+        self._memory: Optional[List[str]] = None
+        self._chat_history: Optional[List[str]] = None
+        self._pending_memory: List[str] = []
+        self._pending_chat_messages: List[str] = []
+        self._flush_timer: Optional[threading.Timer] = None
+        atexit.register(self.flush)
+
+    def memory(self) -> List[str]:
+        """The memorized information about the user, read from disk only on first use"""
+        with self._lock:
+            if self._memory is None:
+                # Information added before the first read may not be flushed yet
+                self._memory = self.store.load_memory() + self._pending_memory
+            return list(self._memory)
+
+    def chat_history(self, n: int = AppConfig.CHAT_HISTORY_CONTEXT) -> List[str]:
+        """The last n chat messages, oldest first"""
+        with self._lock:
+            if self._chat_history is None:
+                self._chat_history = (self.store.last_chat_messages(AppConfig.CHAT_HISTORY_CACHE_SIZE) + self._pending_chat_messages)[-AppConfig.CHAT_HISTORY_CACHE_SIZE:]
+            return self._chat_history[-n:]
+
+    def add_memory(self, information: List[str]) -> None:
+        with self._lock:
+            if self._memory is not None:
+                self._memory.extend(information)
+            self._pending_memory.extend(information)
+            self._schedule_flush()
+
+    def add_chat_messages(self, messages: List[str]) -> None:
+        with self._lock:
+            if self._chat_history is not None:
+                self._chat_history = (self._chat_history + messages)[-AppConfig.CHAT_HISTORY_CACHE_SIZE:]
+            self._pending_chat_messages.extend(messages)
+            self._schedule_flush()
+
+    def _schedule_flush(self) -> None:
+        if self._flush_timer is None:
+            self._flush_timer = threading.Timer(self.flush_delay, self.flush)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+
+    def flush(self) -> None:
+        """Write the pending memory and chat messages to the store"""
+        with self._lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            memory, self._pending_memory = self._pending_memory, []
+            chat_messages, self._pending_chat_messages = self._pending_chat_messages, []
+            if memory:
+                self.store.add_memory(memory)
+            if chat_messages:
+                self.store.add_chat_messages(chat_messages)
+
+    def close(self) -> None:
+        """Write what is pending and stop tracking this session at exit, so a closed session can be garbage collected"""
+        self.flush()
+        atexit.unregister(self.flush)
+
+    def clear(self) -> None:
+        """Forget everything, in memory and on disk"""
+        with self._lock:
+            self._pending_memory, self._pending_chat_messages = [], []
+            self.store.clear()
+            self._memory, self._chat_history = [], []
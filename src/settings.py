@@ -10,14 +10,94 @@ class AppConfig:
 
     LAST_MONTH_TIME = 24*60*60*30   # Jobs listed in the last 30 days
 
+    # JobSpy scraping parameters:
+    SCRAPE_WORKERS = 8              # Scrapes running in parallel across all websites
+    SCRAPE_SITE_CONCURRENCY = 3     # Scrapes running in parallel on the same website
+    SCRAPE_SITE_CONCURRENCY_OVERRIDES = {"indeed": 2, "glassdoor": 2}  # Websites that throttle parallel requests sooner
+
+    # Job catalog parameters:
+    JOB_CATALOG_PATH = "db/cache/job_catalog.sqlite"  # Every scraped posting, shared by all sessions
+    JOB_CATALOG_TTL = 6*60*60       # Searches and postings younger than this are answered without scraping
+    JOB_CATALOG_RETENTION = 24*60*60*30  # Postings are removed from the catalog after 30 days
+    JOB_CATALOG_EXPIRE_INTERVAL = 24*60*60  # Old postings are removed once a day, not on every scrape
+
 
     # UI app parameters: 
     MAX_JOBS = 50                   # Upper range for limit
     MIN_JOBS = 1                    # Lower range for limit
     DEFAULT_LIMIT = 10              # Default limit for number of jobs to return
     COLUMN_SETUP = [1, 0.5,  5]     # Column setup for the UI app
+    SEARCH_PROGRESS_REFRESH = 1.0   # Seconds between refreshes of a background search's progress
+    SEARCH_CANCEL_POLL = 0.5        # Seconds a search waits for the scrapers before checking for cancellation again
 
     # HuntMate core parameters:
-    JOB_MATCH_BATCH_SIZE = 64        # Number of jobs to process in parallel in the LLM Call
+    JOB_MATCH_BATCH_SIZE = 64        # Maximum number of jobs to process in parallel in the LLM Call
+    JOB_MATCH_INITIAL_BATCH_SIZE = 8 # Jobs scored in the first batch, before any strong match rate is known
+    JOB_MATCH_MIN_BATCH_SIZE = 4     # Lower bound for the batches sized from the strong match rate
+    JOB_MATCH_MIN_STRONG_RATE = 0.1  # Floor for the observed strong match rate, so a bad first batch doesn't blow up the next one
+    JOB_MATCH_OVERSAMPLING = 1.5     # Score this many times the jobs expected to be needed, to absorb noise in the observed rate
+    JOB_MATCH_MAX_ATTEMPTS = 3       # Attempts to score a job whose response failed or couldn't be parsed, before skipping it
+    JOB_MATCH_PACKED = False         # Score several jobs per request, check the agreement with benchmarks/bench_packed_scoring.py first
+    JOB_MATCH_PACK_MAX_JOBS = 8      # Most jobs scored by one packed request
+    JOB_MATCH_PACK_MAX_CHARS = 24000 # Characters of job descriptions per packed request, fewer jobs are packed when they are long
+
+    # LLM rate limit parameters:
+    LLM_REQUESTS_PER_MINUTE = 500   # Request budget of the account, requests above it wait instead of being throttled
+    LLM_TOKENS_PER_MINUTE = 200000  # Token budget of the account
+    LLM_CHARS_PER_TOKEN = 4         # Used to estimate the tokens of a request before sending it
+    LLM_EXPECTED_OUTPUT_TOKENS = 200  # Output tokens reserved for each request, corrected with the real usage afterwards
+    LLM_CONCURRENCY_INITIAL = 8     # Parallel requests allowed before the controller has seen any response
+    LLM_CONCURRENCY_MAX = 64        # Upper bound for the parallel requests, whatever the controller learns
+    LLM_CONCURRENCY_DECREASE = 0.5  # The parallel requests are multiplied by this factor on a 429
+    LLM_THROTTLE_MAX_RETRIES = 5    # Retries of a throttled request before giving up on it
+    LLM_THROTTLE_BACKOFF = 1.0      # Base delay in seconds before retrying a throttled request, doubled on each retry
+    LLM_THROTTLE_BACKOFF_MAX = 30.0 # Upper bound for the retry delay
+
+    # LLM tail latency parameters:
+    LLM_FALLBACK_MODEL = None       # Model receiving the hedged and failed requests (e.g. on another provider), the same model when None
+    LLM_HEDGE_PERCENTILE = 95       # A request slower than this latency percentile of its model is sent a second time
+    LLM_HEDGE_MIN_SAMPLES = 20      # Requests are only hedged once the model's latency histogram has this many samples
+    LLM_HEDGE_MIN_DELAY = 0.5       # Requests are never hedged before this many seconds
+    LLM_HEDGE_MAX_RATE = 0.1        # At most this fraction of the requests are hedged, to cap the extra cost
+
+    # Lexical pre-ranking parameters:
+    RANKER_TITLE_WEIGHT = 2.0       # A keyword in the job title counts twice as much as in the description
+    RANKER_EXTRA_PREFERENCES_WEIGHT = 0.5  # Weight of the extra preference terms relative to the job keywords
+    RANKER_MIN_RELATIVE_SCORE = 0.1 # Jobs scoring below this fraction of the best job are not sent to the LLM
+
+    # Storage parameters:
+    STORE_PATH = "db/huntmate.sqlite"  # Memory, chat history and seen jobs of the default user (run without a ChatSession)
+    SESSIONS_DIR = "db/sessions"    # Store and seen jobs of every app user, one directory per user id
+    SESSION_IDLE_TIMEOUT = 60*60    # Chats unused for an hour are closed, they are opened again from disk on the next message
+    SESSION_RETENTION = 24*60*60*30 # The stores of users not seen for 30 days are deleted
+    SESSION_SWEEP_INTERVAL = 24*60*60  # Old stores are looked for once a day
+    CHAT_HISTORY_CONTEXT = 10       # Number of recent chat messages given to the LLM
+    CHAT_HISTORY_CACHE_SIZE = 50    # Number of recent chat messages kept in memory
+    SESSION_FLUSH_DELAY = 2.0       # Seconds before new memory and chat messages are written to disk
+
+    # Seen jobs parameters:
+    SEEN_JOBS_DIR = "db/seen_jobs"  # Bloom filters of the seen jobs, one file per time bucket
+    SEEN_JOBS_TTL = 24*60*60*30     # Seen jobs are shown again after 30 days
+    SEEN_JOBS_BUCKET_SECONDS = 24*60*60  # Seen jobs are grouped and expired per day
+    SEEN_JOBS_BLOOM_CAPACITY = 20000  # Expected number of seen jobs per bucket
+    SEEN_JOBS_BLOOM_ERROR_RATE = 0.01 # False positive rate of the filters, false positives are checked in SQLite
+
+    # Router parameters:
+    ROUTER_CACHE_SIZE = 500         # Past LLM routing decisions kept for reuse
+    ROUTER_CACHE_MIN_SIMILARITY = 0.9  # Cosine similarity of words needed to reuse a past decision
+
+    # Job mention parameters:
+    JOB_MENTION_MIN_SCORE = 85      # Minimum fuzzy score (0-100, plus the company bonus) to pick a job from the user's message
+    JOB_MENTION_MIN_MARGIN = 10     # The best job must beat the second best by this much, otherwise the LLM decides
+    JOB_MENTION_COMPANY_BONUS = 40  # Added to the title score when the company name is in the message
+    JOB_MENTION_MAX_LENGTH = 300    # Longer messages are taken as a pasted job description, not matched by title against the shown jobs
+
+    # LLM cache parameters:
+    LLM_CACHE_PATH = "db/cache/llm_cache.sqlite"  # Shared by all users, db/cache/ only holds data that can be deleted safely
+    LLM_CACHE_TTL = 7*24*60*60      # Cached completions expire after a week
+    LLM_CACHE_MAX_BYTES = 200*1024*1024  # Least recently used completions are evicted above this size
+    LLM_PROMPT_CACHE_MIN_TOKENS = 1024  # Shortest prompt prefix the provider caches (OpenAI), only used to log whether scoring prompts reach it
+    JOB_SCORE_STORE_PATH = "db/cache/job_scores.sqlite"  # Match scores of already scored jobs
+    JOB_SCORE_TTL = 24*60*60*30     # Stored match scores are reused for 30 days
 
     GLASSDOOR_HEADER_UPDATE = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/135.0.0.0 Safari/537.36"
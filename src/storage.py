@@ -0,0 +1,112 @@
+from typing import List, Tuple, Iterable, Optional
+import pandas as pd
+import threading
+import logging
+import sqlite3
+import time
+import os
+
+from src.settings import AppConfig
+
+
+logger = logging.getLogger(__name__)
+
+# SQLite store for the user's memory, the chat history and the seen jobs
+class HuntMateStore:
+    def __init__(self, path: str = AppConfig.STORE_PATH) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS memory (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                information TEXT NOT NULL,
+                created_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS chat_history (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                content TEXT NOT NULL,
+                created_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS seen_jobs (
+                job_id TEXT PRIMARY KEY,
+                seen_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS seen_jobs_seen_at ON seen_jobs (seen_at);
+        """)
+        self._conn.commit()
+        self.migrate_csv_files()
+
+    def migrate_csv_files(self, directory: str = "db") -> None:
+        """Import the CSV files used by older versions once, renaming them so they are not imported again"""
+        migrations = [
+            ("user_info_memory.csv", "Information", self.add_memory),
+            ("chat_history.csv", "chat_history", self.add_chat_messages),
+            ("seen_jobs.csv", "job_id", self.add_seen_jobs),
+        ]
+        for file_name, column, add in migrations:
+            path = os.path.join(directory, file_name)
+            if not os.path.exists(path):
+                continue
+            try:
+                rows = pd.read_csv(path)[column].dropna().astype(str).tolist()
+            except Exception as e:
+                logger.error("Could not migrate %s: %s", path, str(e))
+                continue
+            add(rows)
+            os.replace(path, path + ".migrated")
+            logger.info("Migrated %s rows from %s", len(rows), path)
+
+    def add_memory(self, information: Iterable[str]) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.executemany("INSERT INTO memory (information, created_at) VALUES (?, ?)", [(info, now) for info in information])
+            self._conn.commit()
+
+    def load_memory(self) -> List[str]:
+        """All the memorized information about the user, oldest first"""
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT information FROM memory ORDER BY id")]
+
+    def add_chat_messages(self, messages: Iterable[str]) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.executemany("INSERT INTO chat_history (content, created_at) VALUES (?, ?)", [(message, now) for message in messages])
+            self._conn.commit()
+
+    def last_chat_messages(self, n: int) -> List[str]:
+        """The last n chat messages, oldest first"""
+        with self._lock:
+            rows = self._conn.execute("SELECT content FROM chat_history ORDER BY id DESC LIMIT ?", (n,)).fetchall()
+        return [row[0] for row in reversed(rows)]
+
+    def add_seen_jobs(self, job_ids: Iterable[str], seen_at: Optional[float] = None) -> None:
+        seen_at = time.time() if seen_at is None else seen_at
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO seen_jobs (job_id, seen_at) VALUES (?, ?)", [(str(job_id), seen_at) for job_id in job_ids])
+            self._conn.commit()
+
+    def is_seen_job(self, job_id: str, since: float) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM seen_jobs WHERE job_id = ? AND seen_at >= ?", (job_id, since)).fetchone() is not None
+
+    def seen_jobs_since(self, since: float) -> List[Tuple[str, float]]:
+        with self._lock:
+            return self._conn.execute("SELECT job_id, seen_at FROM seen_jobs WHERE seen_at >= ?", (since,)).fetchall()
+
+    def delete_seen_jobs_before(self, cutoff: float) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM seen_jobs WHERE seen_at < ?", (cutoff,))
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def clear(self) -> None:
+        """Forget the memory, the chat history and the seen jobs"""
+        with self._lock:
+            self._conn.executescript("DELETE FROM memory; DELETE FROM chat_history; DELETE FROM seen_jobs;")
+            self._conn.commit()
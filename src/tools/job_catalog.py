@@ -0,0 +1,151 @@
+from typing import Callable, Optional
+import pandas as pd
+import threading
+import logging
+import sqlite3
+import time
+import os
+
+from src.models import Location
+from src.settings import AppConfig
+
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = ["id", "site", "title", "company", "location", "is_remote", "description", "job_url"]
+
+# Local catalog of every scraped posting, shared by all sessions, with a full-text index
+class JobCatalog:
+    def __init__(self, path: str = AppConfig.JOB_CATALOG_PATH, ttl: float = AppConfig.JOB_CATALOG_TTL) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                search_site TEXT NOT NULL,
+                site TEXT,
+                title TEXT,
+                company TEXT,
+                location TEXT,
+                is_remote INTEGER,
+                description TEXT,
+                job_url TEXT,
+                fetched_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS jobs_site_fetched_at ON jobs (search_site, fetched_at);
+            CREATE TABLE IF NOT EXISTS searches (
+                search_site TEXT NOT NULL,
+                keyword TEXT NOT NULL,
+                location TEXT NOT NULL,
+                fetched_at REAL NOT NULL,
+                PRIMARY KEY (search_site, keyword, location)
+            );
+        """)
+        try:
+            self._create_full_text_index()
+            self.full_text = True
+        except sqlite3.OperationalError:
+            logger.warning("SQLite was built without FTS5, the job catalog falls back to LIKE queries")
+            self.full_text = False
+        self._conn.commit()
+        self.expire()
+
+    def _create_full_text_index(self) -> None:
+        """External-content FTS5 index over the jobs table, kept in sync by triggers on the jobs rowid"""
+        row = self._conn.execute("SELECT sql FROM sqlite_master WHERE name = 'jobs_fts'").fetchone()
+        if row is not None and "content=" not in row[0]:
+            # Catalogs made before the index was external-content keep their own copy of the text, rebuild them
+            self._conn.execute("DROP TABLE jobs_fts")
+            row = None
+        self._conn.executescript("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS jobs_fts USING fts5(title, company, description, content='jobs', content_rowid='rowid');
+            CREATE TRIGGER IF NOT EXISTS jobs_fts_insert AFTER INSERT ON jobs BEGIN
+                INSERT INTO jobs_fts (rowid, title, company, description) VALUES (new.rowid, new.title, new.company, new.description);
+            END;
+            CREATE TRIGGER IF NOT EXISTS jobs_fts_delete AFTER DELETE ON jobs BEGIN
+                INSERT INTO jobs_fts (jobs_fts, rowid, title, company, description) VALUES ('delete', old.rowid, old.title, old.company, old.description);
+            END;
+            CREATE TRIGGER IF NOT EXISTS jobs_fts_update AFTER UPDATE ON jobs BEGIN
+                INSERT INTO jobs_fts (jobs_fts, rowid, title, company, description) VALUES ('delete', old.rowid, old.title, old.company, old.description);
+                INSERT INTO jobs_fts (rowid, title, company, description) VALUES (new.rowid, new.title, new.company, new.description);
+            END;
+        """)
+        if row is None:
+            self._conn.execute("INSERT INTO jobs_fts (jobs_fts) VALUES ('rebuild')")
+
+    @staticmethod
+    def _search_key(keyword: str, location: Location) -> tuple:
+        return keyword.strip().lower(), f"{location.city}, {location.country}".strip().lower()
+
+    def add(self, site: str, keyword: str, location: Location, jobs: pd.DataFrame) -> None:
+        """Store the postings returned by a scrape and remember when this search was made"""
+        now = time.time()
+        frame = jobs.reindex(columns=COLUMNS).astype(object)
+        rows = []
+        for job in frame.where(frame.notna(), None).to_dict("records"):
+            if job["id"] is None:
+                continue
+            rows.append((str(job["id"]), site, job["site"], job["title"], job["company"], job["location"],
+                         None if job["is_remote"] is None else int(bool(job["is_remote"])), job["description"], job["job_url"], now))
+        with self._lock:
+            # An upsert keeps the rowid of a known posting, so the update trigger re-indexes only that row
+            self._conn.executemany(
+                """INSERT INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT (id) DO UPDATE SET search_site = excluded.search_site, site = excluded.site, title = excluded.title,
+                       company = excluded.company, location = excluded.location, is_remote = excluded.is_remote,
+                       description = excluded.description, job_url = excluded.job_url, fetched_at = excluded.fetched_at""",
+                rows)
+            self._conn.execute("INSERT OR REPLACE INTO searches VALUES (?, ?, ?, ?)", (site, *self._search_key(keyword, location), now))
+            self._conn.commit()
+        if now - self._expired_at >= AppConfig.JOB_CATALOG_EXPIRE_INTERVAL:
+            self.expire()
+
+    def expire(self) -> None:
+        """Remove the postings and searches older than JOB_CATALOG_RETENTION, at most once per JOB_CATALOG_EXPIRE_INTERVAL"""
+        now = time.time()
+        with self._lock:
+            self._expired_at = now
+            self._conn.execute("DELETE FROM jobs WHERE fetched_at < ?", (now - AppConfig.JOB_CATALOG_RETENTION,))
+            self._conn.execute("DELETE FROM searches WHERE fetched_at < ?", (now - AppConfig.JOB_CATALOG_RETENTION,))
+            self._conn.commit()
+
+    def search(self, site: str, keyword: str, location: Location, limit: int) -> pd.DataFrame:
+        """Fresh postings of a website matching the keyword phrase and the city, most recent first"""
+        since = time.time() - self.ttl
+        city = f"%{location.city.lower()}%"
+        columns = ", ".join(f"jobs.{column}" for column in COLUMNS)
+        with self._lock:
+            if self.full_text:
+                phrase = '"' + keyword.replace('"', '""') + '"'
+                rows = self._conn.execute(
+                    f"""SELECT {columns} FROM jobs_fts JOIN jobs ON jobs.rowid = jobs_fts.rowid
+                        WHERE jobs_fts MATCH ? AND jobs.search_site = ? AND jobs.fetched_at >= ? AND lower(jobs.location) LIKE ?
+                        ORDER BY jobs.fetched_at DESC LIMIT ?""",
+                    (phrase, site, since, city, limit)).fetchall()
+            else:
+                pattern = f"%{keyword.lower()}%"
+                rows = self._conn.execute(
+                    f"""SELECT {columns} FROM jobs
+                        WHERE (lower(title) LIKE ? OR lower(description) LIKE ?) AND search_site = ? AND fetched_at >= ? AND lower(location) LIKE ?
+                        ORDER BY fetched_at DESC LIMIT ?""",
+                    (pattern, pattern, site, since, city, limit)).fetchall()
+        jobs = pd.DataFrame(rows, columns=COLUMNS)
+        jobs["is_remote"] = jobs["is_remote"].map(lambda value: None if value is None else bool(value))
+        return jobs
+
+    def lookup(self, site: str, keyword: str, location: Location, results_wanted: int, is_new: Callable[[str], bool]) -> Optional[pd.DataFrame]:
+        """Answer a scrape from the catalog when the same search is still fresh and found postings the user hasn't seen,
+        or when the catalog already holds enough fresh unseen postings. Returns None when the website must be scraped."""
+        with self._lock:
+            row = self._conn.execute("SELECT fetched_at FROM searches WHERE search_site = ? AND keyword = ? AND location = ?",
+                                     (site, *self._search_key(keyword, location))).fetchone()
+        fresh_search = row is not None and time.time() - row[0] <= self.ttl
+        jobs = self.search(site, keyword, location, max(results_wanted * 2, results_wanted + 50))
+        new_jobs = sum(is_new(job_id) for job_id in jobs["id"])
+        if (fresh_search and new_jobs > 0) or new_jobs >= results_wanted:
+            logger.info("Job catalog answered %s for %s in %s with %s jobs", site, keyword, location.city, len(jobs))
+            return jobs
+        return None
@@ -0,0 +1,58 @@
+from rapidfuzz.distance import Indel
+from rapidfuzz import process
+from typing import List, Dict, Optional
+import numpy as np
+
+
+DEDUP_BATCH_SIZE = 128  # Jobs compared against all unique jobs in one similarity matrix
+
+
+# Job de-duplication on company and title similarity, computed as batched similarity matrices
+class JobDeduplicator:
+    """Gives the same output as comparing every job against every unique job so far with Levenshtein.ratio
+    (which is rapidfuzz's normalized Indel similarity), but compares a whole batch of jobs at once in C++."""
+
+    def __init__(self, threshold: float = 0.5) -> None:
+        self.threshold = threshold
+        self.companies: List[Optional[str]] = []  # Company and title of every unique job
+        self.titles: List[Optional[str]] = []
+        self.known = set()  # (company, title) pairs already processed, duplicates of a unique job from now on
+
+    @staticmethod
+    def normalize(value) -> Optional[str]:
+        # Same rule as the original pairwise check: anything that is not a string is similar to everything
+        return value.lower() if type(value) == str else None
+
+    def similarity_matrix(self, queries: List[Optional[str]], choices: List[Optional[str]]) -> np.ndarray:
+        """Boolean matrix of which queries are similar to which choices, comparing each distinct string pair once"""
+        query_ids, choice_ids = {}, {}
+        query_map = np.array([query_ids.setdefault(s, len(query_ids)) if s is not None else -1 for s in queries], dtype=np.int64)
+        choice_map = np.array([choice_ids.setdefault(s, len(choice_ids)) if s is not None else -1 for s in choices], dtype=np.int64)
+        similar = np.ones((len(queries), len(choices)), dtype=bool)
+        if query_ids and choice_ids:
+            scores = process.cdist(list(query_ids), list(choice_ids), scorer=Indel.normalized_similarity, dtype=np.float64, workers=-1)
+            valid_queries, valid_choices = query_map >= 0, choice_map >= 0
+            similar[np.ix_(valid_queries, valid_choices)] = (scores >= self.threshold)[np.ix_(query_map[valid_queries], choice_map[valid_choices])]
+        return similar
+
+    def deduplicate(self, jobs: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        """Return the jobs that are not similar in both company and title to an earlier unique job"""
+        unique_jobs = []
+        for start in range(0, len(jobs), DEDUP_BATCH_SIZE):
+            batch = jobs[start:start + DEDUP_BATCH_SIZE]
+            companies = [self.normalize(job["company"]) for job in batch]
+            titles = [self.normalize(job["title"]) for job in batch]
+            num_unique = len(self.titles)
+            # Compare the batch against the unique jobs so far and against itself
+            similar = self.similarity_matrix(companies, self.companies + companies) & self.similarity_matrix(titles, self.titles + titles)
+            is_unique = np.zeros(num_unique + len(batch), dtype=bool)
+            is_unique[:num_unique] = True
+            for i, job in enumerate(batch):
+                pair = (companies[i], titles[i])
+                if pair not in self.known and not (similar[i] & is_unique).any():
+                    is_unique[num_unique + i] = True
+                    self.companies.append(companies[i])
+                    self.titles.append(titles[i])
+                    unique_jobs.append(job)
+                self.known.add(pair)
+        return unique_jobs
@@ -1,50 +1,52 @@
-from jobspy import scrape_jobs
-from typing import List, Dict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Iterator, Optional
 import pandas as pd
 import Levenshtein
+import threading
 import logging
 import time
-import os
 
 
-from src.models import JobSearchParams
+from src.tools.job_dedup import JobDeduplicator
+from src.tools.job_catalog import JobCatalog
+from src.models import JobSearchParams, Location
 from src.settings import AppConfig
+from src.seen_jobs import SeenJobsIndex
 
 
-# The default user agent is blocked by glassdoor, so we need to change it
-from jobspy.glassdoor.constant import headers
-headers["user-agent"] = AppConfig.GLASSDOOR_HEADER_UPDATE
+logger = logging.getLogger(__name__)
 
-from jobspy.linkedin.constant import headers
-headers["user-agent"] = AppConfig.GLASSDOOR_HEADER_UPDATE
 
+def load_scraper():
+    """Import jobspy on the first scrape, as it is slow to import"""
+    from jobspy import scrape_jobs
+
+    # The default user agent is blocked by glassdoor, so we need to change it
+    from jobspy.glassdoor.constant import headers
+    headers["user-agent"] = AppConfig.GLASSDOOR_HEADER_UPDATE
+
+    from jobspy.linkedin.constant import headers
+    headers["user-agent"] = AppConfig.GLASSDOOR_HEADER_UPDATE
+    return scrape_jobs
 
-logger = logging.getLogger(__name__)
 
 class JobSpySearchTool:
-    def __init__(self):
-        pass
+    def __init__(self, catalog: JobCatalog):
+        self.catalog = catalog
+        self.site_semaphores = {}
+        self.site_semaphores_lock = threading.Lock()
+
+    def site_semaphore(self, site: str) -> threading.Semaphore:
+        """ Semaphore limiting the number of parallel scrapes of a website """
+        with self.site_semaphores_lock:
+            if site not in self.site_semaphores:
+                concurrency = AppConfig.SCRAPE_SITE_CONCURRENCY_OVERRIDES.get(site, AppConfig.SCRAPE_SITE_CONCURRENCY)
+                self.site_semaphores[site] = threading.Semaphore(concurrency)
+            return self.site_semaphores[site]
     
     def remove_duplicate_jobs(self, all_jobs: List[Dict[str, str]]) -> List[Dict[str, str]]:
         """ Remove duplicate jobs based on company and title edit distance """
-
-        def is_similar(str1: str, str2: str, threshold: float = 0.5) -> bool:
-            """Check if two strings are similar based on a threshold using Levenshtein ratio."""
-            if type(str1) != str or type(str2) != str:
-                return True
-            return Levenshtein.ratio(str1.lower(), str2.lower()) >= threshold
-
-        unique_jobs = []
-        for i, job in enumerate(all_jobs):
-            duplicate_found = False
-            for unique_job in unique_jobs:
-                if is_similar(job["company"], unique_job["company"]) and is_similar(job["title"], unique_job["title"]):
-                    duplicate_found = True
-                    break
-            if not duplicate_found:
-                unique_jobs.append(job)
-
-        return unique_jobs
+        return JobDeduplicator().deduplicate(all_jobs)
 
     def check_location_similarity(self, location1: str, location2: str) -> bool:
         """ Check for the similary between the job's location and the user's location """
@@ -67,69 +69,92 @@ class JobSpySearchTool:
                     return website_selected
         return website
 
-    def job_search(self, search_params: JobSearchParams, websites: List[str]) -> List[Dict[str, str]]:
-        """ Search for jobs using jobspy """
+    def scrape_site(self, site: str, keyword: str, location: Location, final_limit: int, seen_jobs: SeenJobsIndex) -> pd.DataFrame:
+        """ Scrape one website for a keyword and location pair, waiting for a free slot of that website.
+        Searches that the job catalog can answer are not scraped at all """
+        cached = self.catalog.lookup(site, keyword, location, final_limit, lambda job_id: job_id not in seen_jobs)
+        if cached is not None:
+            return cached
+        search_term_str = '"' + keyword + '"'
+        google_search_str = search_term_str + ' in ' + location.city if site == "google" else ""
+        scrape_jobs = load_scraper()
+        with self.site_semaphore(site):
+            start_time = time.time()
+            try:
+                jobs = scrape_jobs(
+                    site_name=[site],
+                    search_term= search_term_str,
+                    location=location.city,
+                    google_search_term=google_search_str,
+                    results_wanted=final_limit,
+                    hours_old=AppConfig.LAST_MONTH_TIME,
+                    country_indeed=location.country,
+                )
+            except Exception as e:
+                logging.error(f"Error searching for jobs: {str(e)}")
+                return pd.DataFrame()
+            end_time = time.time()
+        logging.info(f"JOBSPY {site} (end - start): {end_time - start_time} seconds")
+        self.catalog.add(site, keyword, location, jobs)
+        return jobs
+
+    def job_search_stream(self, search_params: JobSearchParams, websites: List[str], seen_jobs: SeenJobsIndex,
+                          stop_event: Optional[threading.Event] = None) -> Iterator[List[Dict[str, str]]]:
+        """ Search for jobs using jobspy, yielding the new jobs of each keyword and location pair as soon as it is scraped.
+        Jobs in the user's seen_jobs are skipped """
         if websites is None:
-            return []  
+            return
         websites = [w.lower() for w in websites]
         final_limit = search_params.limit + AppConfig.EXTRA_JOBS_TO_SEARCH_LOWER
         if len(search_params.job_keywords) == 1 and len(search_params.locations) == 1:
             final_limit = search_params.limit + AppConfig.EXTRA_JOBS_TO_SEARCH_UPPER # Add extra jobs to account for duplicates or wrong matches
 
     
-        if "seen_jobs.csv" not in os.listdir("./db"):
-            seen_jobs = set()
-        else:   
-            seen_jobs = set(pd.read_csv("./db/seen_jobs.csv")["job_id"])
-
-        all_jobs = []
-        search_websites = websites
-        if "linkedin" in websites:
-            search_websites.remove("linkedin")
-        for keyword in search_params.job_keywords[:AppConfig.MAX_SEARCH_ITEMS]: 
-            for location in search_params.locations[:AppConfig.MAX_SEARCH_ITEMS]:
-                start_time = time.time()
-                google_search_str = ""
-                search_term_str = '"' + keyword + '"'
-                if "google" in websites:
-                    google_search_str = search_term_str + ' in ' + location.city
-                try:
-                    jobs = scrape_jobs(
-                        site_name=search_websites,
-                        search_term= search_term_str,
-                        location=location.city,
-                        google_search_term=google_search_str,
-                        results_wanted=final_limit,
-                        hours_old=AppConfig.LAST_MONTH_TIME,
-                        country_indeed=location.country,
-                    )
-                except Exception as e:
-                    logging.error(f"Error searching for jobs: {str(e)}")
-                    continue
-                print(">>>", len(jobs))
-                for i in range(len(jobs)):
-                    if jobs["id"][i] in seen_jobs:
+        search_seen_jobs = set()  # Jobs already found in this search, they are only marked as seen once they are shown
+
+        deduplicator = JobDeduplicator()
+        websites = [w for w in websites if w != "linkedin"]
+        combinations = [(keyword, location) for keyword in search_params.job_keywords[:AppConfig.MAX_SEARCH_ITEMS]
+                        for location in search_params.locations[:AppConfig.MAX_SEARCH_ITEMS]]
+        executor = ThreadPoolExecutor(max_workers=AppConfig.SCRAPE_WORKERS, thread_name_prefix="huntmate-scrape")
+        try:
+            # One scrape per website and keyword/location pair, capped per website by the site semaphores
+            futures = [[executor.submit(self.scrape_site, site, keyword, location, final_limit, seen_jobs) for site in websites]
+                       for keyword, location in combinations]
+            # Results are merged in submission order so the output doesn't depend on which scrape finishes first
+            for (keyword, location), site_futures in zip(combinations, futures):
+                new_jobs = []
+                for future in site_futures:
+                    if stop_event is not None and stop_event.is_set():
+                        return
+                    jobs = future.result()
+                    for i in range(len(jobs)):
+                        job_id = str(jobs["id"][i])
+                        if job_id in search_seen_jobs or job_id in seen_jobs:
+                                continue
+                        if not self.check_location_similarity(str(jobs["location"][i]), location.city):
                             continue
-                    if not self.check_location_similarity(str(jobs["location"][i]), location.city):
-                        continue
-                    seen_jobs.add(jobs["id"][i])
-                
-                    all_jobs.append({
-                        "title": jobs["title"][i],
-                        "company": jobs["company"][i],
-                        "location": jobs["location"][i],
-                        "remote_allowed": jobs["is_remote"][i],
-                        "job_description": jobs["description"][i] if jobs["description"][i] else "No description available.",
-                        "job_posting_link": jobs["job_url"][i],
-                        "job_id": jobs["id"][i],
-                        "site": self.fix_website_name(jobs["site"][i], jobs["job_url"][i], websites),
-                    })
-                end_time = time.time()
-                logging.info(f"JOBSPY (end - start): {end_time - start_time} seconds")
-
-        seen_jobs_df = pd.DataFrame(seen_jobs, columns=["job_id"])
-        seen_jobs_df.to_csv("./db/seen_jobs.csv", index=False)
-        if len(websites) == 1:
-            return all_jobs
-        
-        return self.remove_duplicate_jobs(all_jobs)
\ No newline at end of file
+                        search_seen_jobs.add(job_id)
+                    
+                        new_jobs.append({
+                            "title": jobs["title"][i],
+                            "company": jobs["company"][i],
+                            "location": jobs["location"][i],
+                            "remote_allowed": jobs["is_remote"][i],
+                            "job_description": jobs["description"][i] if jobs["description"][i] else "No description available.",
+                            "job_posting_link": jobs["job_url"][i],
+                            "job_id": jobs["id"][i],
+                            "site": self.fix_website_name(jobs["site"][i], jobs["job_url"][i], websites),
+                        })
+                # Duplicates across job boards are only possible when searching more than one website
+                if len(websites) > 1:
+                    new_jobs = deduplicator.deduplicate(new_jobs)
+                logger.info("Found %s new jobs for %s in %s", len(new_jobs), keyword, location.city)
+                # Empty lists are yielded too, so consumers can follow the progress of the search
+                yield new_jobs
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def job_search(self, search_params: JobSearchParams, websites: List[str], seen_jobs: SeenJobsIndex) -> List[Dict[str, str]]:
+        """ Search for jobs using jobspy """
+        return [job for jobs in self.job_search_stream(search_params, websites, seen_jobs) for job in jobs]
@@ -1,15 +1,14 @@
 
 from my_linkedin_api import Linkedin
-from typing import List, Dict, Any
-import pandas as pd
+from typing import List, Dict, Any, Optional
 import configparser
 import logging
 import time
-import os
 
 
 from src.models import JobSearchParams
 from src.settings import AppConfig
+from src.seen_jobs import SeenJobsIndex
 import asyncio
 
 
@@ -49,15 +48,23 @@ class LinkedinSearchTool:
             return ""
     
 
-    def job_search(self, search_params: JobSearchParams) -> List[Dict[str, str]]:
+    def job_search(self, search_params: JobSearchParams, seen_jobs: SeenJobsIndex) -> List[Dict[str, str]]:
         """ Search for jobs on LinkedIn """
+        return asyncio.run(self.ajob_search(search_params, seen_jobs))
+
+    async def fetch_job_details(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """ Fetch the details of a job without blocking the event loop """
+        try:
+            details = await asyncio.to_thread(self.api.get_job, job_id)
+        except Exception as e:
+            logger.error(f"Error fetching job {job_id}: {str(e)}")
+            return None
+        return {"job_id": job_id, "details": details}
+
+    async def ajob_search(self, search_params: JobSearchParams, seen_jobs: SeenJobsIndex) -> List[Dict[str, str]]:
+        """ Search for jobs on LinkedIn, fetching the details of the jobs of each search concurrently """
         all_jobs = []
-        if "db" not in os.listdir():
-            os.mkdir("db")
-        if "seen_jobs.csv" not in os.listdir("./db"):
-            seen_jobs = set()
-        else:   
-            seen_jobs = set(pd.read_csv("./db/seen_jobs.csv")["job_id"])
+        search_seen_jobs = set()  # Jobs already found in this search, they are only marked as seen once they are shown
 
         logging.info("Searching for jobs on LinkedIn")
         final_limit = search_params.limit
@@ -76,63 +83,40 @@ class LinkedinSearchTool:
                 logger.info(f"Search parameters: {input_search}")
                 start_time = time.time()
                 try:
-                    jobs = self.api.search_jobs(**input_search)
+                    jobs = await asyncio.to_thread(self.api.search_jobs, **input_search)
                 except Exception as e:
                     logger.error(f"Error searching for jobs: {str(e)}")
                     continue
-                
-                async def fetch_job_details(job_id):
-                    def blocking_call():
-                        try:
-                            details = self.api.get_job(job_id)
-                            return {
-                                "job_id": job_id,
-                                "details": details
-                            }
-                        except Exception as e:
-                            logger.error(f"Error fetching job {job_id}: {str(e)}")
-                            return None
-
-                    return await asyncio.to_thread(blocking_call)
-
-                async def process_jobs(jobs):
-                    tasks = []
-                    for job in jobs:
-                        job_id = str(job["entityUrn"]).split(":")[-1]
-                        if job_id in seen_jobs:
-                            continue
-
-                        seen_jobs.add(job_id)
-                        tasks.append(fetch_job_details(job_id))
-
-                    results = []
-                    batch_results = await asyncio.gather(*tasks, return_exceptions=True)
-                    results.extend(batch_results)
-                    
-                    for result in results:
-                        if result and isinstance(result, dict):
-                            details = result["details"]
-                            job_id = result["job_id"]
-                            select_info = {
-                                "title": details.get('title', 'unknown'),
-                                "company": self.get_company_name(details),
-                                "location": details.get('formattedLocation', 'unknown'),
-                                "remote_allowed": details.get('workRemoteAllowed', 'unknown'),
-                                "job_description": details.get('description', dict()).get('text', 'unknown'),
-                                "job_posting_link": "https://www.linkedin.com/jobs/view/" + job_id,
-                                "job_id": job_id,
-                                "site": "LinkedIn",
-                            }
-                            all_jobs.append(select_info)
-
-                asyncio.run(process_jobs(jobs))
+
+                tasks = []
+                for job in jobs:
+                    job_id = str(job["entityUrn"]).split(":")[-1]
+                    if job_id in search_seen_jobs or job_id in seen_jobs:
+                        continue
+
+                    search_seen_jobs.add(job_id)
+                    tasks.append(self.fetch_job_details(job_id))
+
+                for result in await asyncio.gather(*tasks):
+                    if result is None:
+                        continue
+                    details = result["details"]
+                    job_id = result["job_id"]
+                    select_info = {
+                        "title": details.get('title', 'unknown'),
+                        "company": self.get_company_name(details),
+                        "location": details.get('formattedLocation', 'unknown'),
+                        "remote_allowed": details.get('workRemoteAllowed', 'unknown'),
+                        "job_description": details.get('description', dict()).get('text', 'unknown'),
+                        "job_posting_link": "https://www.linkedin.com/jobs/view/" + job_id,
+                        "job_id": job_id,
+                        "site": "LinkedIn",
+                    }
+                    all_jobs.append(select_info)
 
                 end_time = time.time()
                 logging.info(f"LinkedIn Time taken for search (end - start): {end_time - start_time} seconds")
 
-        seen_jobs_df = pd.DataFrame(seen_jobs, columns=["job_id"])
-        seen_jobs_df.to_csv("./db/seen_jobs.csv", index=False)
-
         logging.info("Finished searching for jobs on LinkedIn. Total jobs found: %s", len(all_jobs))
         return all_jobs 
     